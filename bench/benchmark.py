@@ -0,0 +1,168 @@
+"""
+End-to-end benchmark: the real bridge against simulated CoolMasterNet controller(s)
+and an in-process MQTT broker stand-in, all on localhost.
+
+    python -m bench.benchmark --units 200 --latency 0.005 --churn 0.1 --duration 30 --commands 30
+
+Bridge settings (POLL_INTERVAL, MQTT_PUBLISH_MODE, ...) are taken from the
+environment as usual; only the hosts and ports are overridden.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import time
+
+from bench.broker import BrokerStandIn
+from bench.simulator import CoolMasterSimulator
+
+
+def _percentiles(samples):
+    if not samples:
+        return "n/a"
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (f"p50 {statistics.median(ordered) * 1000:.1f}ms  p95 {p95 * 1000:.1f}ms  "
+            f"max {ordered[-1] * 1000:.1f}ms  (n={len(ordered)})")
+
+
+async def run(args):
+    sims = [CoolMasterSimulator(args.units, args.latency, args.churn, seed=i) for i in range(args.controllers)]
+    ports = [await sim.start() for sim in sims]
+    broker = BrokerStandIn()
+    broker_port = await broker.start()
+
+    os.environ["MQTT_HOST"], os.environ["MQTT_PORT"] = "127.0.0.1", str(broker_port)
+    os.environ["POLL_REPORT_INTERVAL"] = "0"
+    if args.controllers == 1:
+        os.environ["COOLMASTER_HOST"], os.environ["COOLMASTER_PORT"] = "127.0.0.1", str(ports[0])
+        os.environ.pop("COOLMASTER_HOSTS", None)
+        names = [""]
+    else:
+        names = [f"c{i + 1}" for i in range(args.controllers)]
+        os.environ["COOLMASTER_HOSTS"] = ",".join(f"{n}=127.0.0.1:{p}" for n, p in zip(names, ports))
+
+    import main  # config is read at import time, so only after the environment is set
+
+    command_acks, state_latencies, readback_latencies = [], [], []
+    pending_wire = {}      # (controller index, device uid) -> sent_at
+    pending_readback = {}  # (controller index, device uid) -> sent_at, once the command reached the controller
+    pending_state = {}  # state topic -> (setpoint, sent_at)
+
+    def on_controller_command(index):
+        def listener(verb, cmd_args, received_at, replied_at):
+            if verb == "temp" and cmd_args:
+                sent = pending_wire.pop((index, cmd_args[0]), None)
+                if sent is not None:
+                    command_acks.append(replied_at - sent)
+                    pending_readback[(index, cmd_args[0])] = sent
+            elif verb == "ls2" and cmd_args:
+                # The bridge reads the unit back straight after a command; that reply confirms the new state
+                sent = pending_readback.pop((index, cmd_args[0]), None)
+                if sent is not None:
+                    readback_latencies.append(replied_at - sent)
+        return listener
+
+    def on_publish(topic, payload, received_at):
+        if topic not in pending_state:
+            return
+        setpoint, sent = pending_state[topic]
+        try:
+            value = json.loads(payload)["temperature"] if topic.endswith("/state") else float(payload)
+        except (ValueError, KeyError, TypeError):
+            return
+        if value == setpoint:
+            del pending_state[topic]
+            state_latencies.append(received_at - sent)
+
+    for index, sim in enumerate(sims):
+        sim.command_listener = on_controller_command(index)
+    broker.publish_listener = on_publish
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        loop = asyncio.get_running_loop()
+        booted = time.monotonic()
+        controllers, mqtt, last_status = main.build_bridge(loop)
+        tasks = [asyncio.create_task(main.poll_controller(c, mqtt, last_status)) for c in controllers]
+
+        # Warm-up: wait for the first full publish of every unit to reach the broker
+        total_units = args.units * args.controllers
+        deadline = time.monotonic() + 60
+        while len(last_status) < total_units and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await mqtt.queue.flush()
+        warmup = time.monotonic() - booted
+
+        broker.received = broker.received_bytes = 0
+        cycles_before = [{name: s.cycles for name, s in c.schedulers().items()} for c in controllers]
+        rng = random.Random(0)
+        command_gap = args.duration / args.commands if args.commands else args.duration
+
+        started = time.monotonic()
+        for _ in range(args.commands):
+            index = rng.randrange(args.controllers)
+            unit = rng.choice(list(sims[index].units.values()))
+            low, high = unit.limits
+            setpoint = float(rng.choice([t for t in range(low, high + 1) if t != unit.setpoint]))
+            uid = f"{names[index]}.{unit.uid}" if names[index] else unit.uid
+            base = f"homeassistant/climate/coolmaster_{uid.replace('.', '_')}"
+            state_topic = f"{base}/temperature" if mqtt.publish_mode == "attributes" else f"{base}/state"
+
+            sent = time.monotonic()
+            pending_wire[(index, unit.uid)] = sent
+            pending_state[state_topic] = (setpoint, sent)
+            broker.inject(f"{base}/set/temperature", str(setpoint))
+            await asyncio.sleep(command_gap)
+        await asyncio.sleep(max(0.0, args.duration - (time.monotonic() - started)))
+        elapsed = time.monotonic() - started
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for controller in controllers:
+            await controller.close()
+        mqtt.client.loop_stop()
+        mqtt.client.disconnect()
+
+    await broker.stop()
+    for sim in sims:
+        await sim.stop()
+
+    print(f"Bridge benchmark — {args.controllers} controller(s) × {args.units} units, "
+          f"latency {args.latency * 1000:.0f}ms, churn {args.churn:.0%}/s, {elapsed:.1f}s measured")
+    print(f"  publish mode                   {mqtt.publish_mode}")
+    print(f"  MQTT transport                 {mqtt.transport}")
+    print(f"  warm-up (first full publish)   {warmup:.2f}s")
+    for controller, before in zip(controllers, cycles_before):
+        for shard, scheduler in controller.schedulers().items():
+            s = scheduler.stats()
+            label = "".join(f"[{part}] " for part in (controller.name, shard) if part) + "poll cycle"
+            print(f"  {label:<31}avg {s['cycle_time_avg'] * 1000:.1f}ms  max {s['cycle_time_max'] * 1000:.1f}ms  "
+                  f"{(s['cycles'] - before[shard]) / elapsed:.2f} cycles/s  {s['overruns']} overruns")
+    print(f"  command → controller OK        {_percentiles(command_acks)}")
+    print(f"  command → optimistic publish   {_percentiles(state_latencies)}")
+    print(f"  command → read back            {_percentiles(readback_latencies)}")
+    print(f"  MQTT publishes                 {broker.received / elapsed:.1f}/s  ({broker.received_bytes / elapsed / 1024:.1f} KiB/s)")
+    q = mqtt.queue.stats()
+    print(f"  publish queue                  high water {q['high_water']}  coalesced {q['coalesced']}  dropped {q['dropped']}  "
+          f"ack avg {q['ack_latency_avg'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CoolMaster → MQTT bridge end-to-end benchmark")
+    parser.add_argument("--units", type=int, default=15, help="units per simulated controller (1 to 1000)")
+    parser.add_argument("--controllers", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated controller reply delay, seconds")
+    parser.add_argument("--churn", type=float, default=0.1, help="fraction of units changing per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds after warm-up")
+    parser.add_argument("--commands", type=int, default=20, help="set/temperature commands sent during the run")
+    parser.add_argument("--verbose", action="store_true", help="show the bridge's own log output")
+    args = parser.parse_args()
+    if not 1 <= args.units <= 1000:
+        parser.error("--units must be between 1 and 1000")
+    asyncio.run(run(args))
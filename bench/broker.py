@@ -0,0 +1,201 @@
+import asyncio
+import struct
+import time
+
+from mqtt.async_client import _read_properties, _varint
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+TOPIC_ALIAS, TOPIC_ALIAS_MAXIMUM = 0x23, 0x22
+
+
+def topic_matches(pattern, topic):
+    """MQTT filter match with `+` and `#` wildcards."""
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+def _packet(packet_type, body, flags=0):
+    header = bytearray([(packet_type << 4) | flags])
+    length = len(body)
+    while True:
+        byte, length = length % 128, length // 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            break
+    return bytes(header) + body
+
+
+def _string(data, offset):
+    (length,) = struct.unpack_from("!H", data, offset)
+    return data[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+class _Session:
+    __slots__ = ("writer", "subscriptions", "client_id", "version", "aliases")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.subscriptions = []
+        self.client_id = None
+        self.version = 4   # 4 = MQTT 3.1.1, 5 = MQTT 5
+        self.aliases = {}  # topic alias -> topic, set by the client (MQTT 5)
+
+
+class BrokerStandIn:
+    """
+    Minimal in-process MQTT 3.1.1 / 5 broker for benchmarks.
+
+    Handles CONNECT, PUBLISH (QoS 0/1), SUBSCRIBE, UNSUBSCRIBE, PINGREQ and
+    DISCONNECT, keeps retained messages, and delivers everything to subscribers
+    at QoS 0. MQTT 5 clients are granted `topic_alias_maximum` inbound topic
+    aliases. `inject()` publishes as if from another client (e.g. Home Assistant
+    sending a command) and `publish_listener` sees every message clients send.
+    """
+
+    def __init__(self, topic_alias_maximum=1000):
+        self.topic_alias_maximum = topic_alias_maximum
+        self.server = None
+        self.port = None
+        self.sessions = []
+        self._handlers = set()
+        self.retained = {}
+        self.publish_listener = None  # callable(topic, payload, received_at)
+        self.received = 0
+        self.received_bytes = 0
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+        for session in self.sessions:
+            session.writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        if self.server:
+            await self.server.wait_closed()
+
+    def inject(self, topic, payload, retain=False):
+        self._route(topic, payload.encode() if isinstance(payload, str) else payload, retain)
+
+    def _route(self, topic, payload, retain):
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        for session in self.sessions:
+            if any(topic_matches(p, topic) for p in session.subscriptions):
+                self._deliver(session, topic, payload)
+
+    def _deliver(self, session, topic, payload, retain=False):
+        encoded = topic.encode()
+        properties = b"\x00" if session.version == 5 else b""
+        body = struct.pack("!H", len(encoded)) + encoded + properties + payload
+        session.writer.write(_packet(PUBLISH, body, 0x01 if retain else 0))
+
+    async def _handle(self, reader, writer):
+        session = _Session(writer)
+        self.sessions.append(session)
+        self._handlers.add(asyncio.current_task())
+        try:
+            while True:
+                first = await reader.readexactly(1)
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                if not self._dispatch(session, first[0] >> 4, first[0] & 0x0F, body):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            self.sessions.remove(session)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def _dispatch(self, session, packet_type, flags, body):
+        writer = session.writer
+        if packet_type == CONNECT:
+            _, offset = _string(body, 0)                 # protocol name
+            session.version = body[offset]
+            offset += 4                                  # level, flags, keepalive
+            if session.version == 5:
+                _, offset = _read_properties(body, offset)
+            session.client_id, _ = _string(body, offset)
+            if session.version == 5:
+                properties = bytes([TOPIC_ALIAS_MAXIMUM]) + struct.pack("!H", self.topic_alias_maximum)
+                writer.write(_packet(CONNACK, b"\x00\x00" + _varint(len(properties)) + properties))
+            else:
+                writer.write(_packet(CONNACK, b"\x00\x00"))
+
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = _string(body, 0)
+            if qos:
+                packet_id = body[offset:offset + 2]
+                offset += 2
+                writer.write(_packet(PUBACK, packet_id))
+            if session.version == 5:
+                properties, offset = _read_properties(body, offset)
+                alias = properties.get(TOPIC_ALIAS)
+                if alias is not None:
+                    if topic:
+                        session.aliases[alias] = topic
+                    else:
+                        topic = session.aliases[alias]
+            payload = body[offset:]
+            self.received += 1
+            self.received_bytes += len(body)
+            if self.publish_listener:
+                self.publish_listener(topic, payload, time.monotonic())
+            self._route(topic, payload, bool(flags & 0x01))
+
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, patterns = body[:2], 2, []
+            if session.version == 5:
+                _, offset = _read_properties(body, offset)
+            while offset < len(body):
+                pattern, offset = _string(body, offset)
+                offset += 1  # requested QoS; everything is delivered at QoS 0
+                patterns.append(pattern)
+            session.subscriptions += patterns
+            properties = b"\x00" if session.version == 5 else b""
+            writer.write(_packet(SUBACK, packet_id + properties + bytes(len(patterns))))
+            for topic, payload in self.retained.items():
+                if any(topic_matches(p, topic) for p in patterns):
+                    self._deliver(session, topic, payload, retain=True)
+
+        elif packet_type == UNSUBSCRIBE:
+            offset, count = 2, 0
+            if session.version == 5:
+                _, offset = _read_properties(body, offset)
+            while offset < len(body):
+                pattern, offset = _string(body, offset)
+                count += 1
+                if pattern in session.subscriptions:
+                    session.subscriptions.remove(pattern)
+            writer.write(_packet(UNSUBACK, body[:2] + (b"\x00" + bytes(count) if session.version == 5 else b"")))
+
+        elif packet_type == PINGREQ:
+            writer.write(_packet(PINGRESP, b""))
+
+        elif packet_type == DISCONNECT:
+            return False
+
+        return True
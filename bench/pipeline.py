@@ -0,0 +1,72 @@
+"""
+Pipelining measurement: how many commands per second one connection sustains at
+several COOLMASTER_PIPELINE_DEPTH settings, against the simulator or a real controller.
+
+    python -m bench.pipeline --units 50 --rtt 0.005 --latency 0.001 --depths 1,2,4,8
+    python -m bench.pipeline --host 192.168.1.50 --depths 1,4
+
+Only read-only `ls2 <uid>` queries are sent, so pointing it at a live controller is safe.
+Each response is checked against the unit it was asked for, which proves the in-order matching.
+"""
+import argparse
+import asyncio
+import time
+
+from bench.simulator import CoolMasterSimulator
+from coolmaster.client import CoolMasterClient, PRIORITY_COMMAND
+
+
+async def measure(host, port, depth, rounds, limit):
+    client = CoolMasterClient(host, port, name=f"depth {depth}", pipeline_depth=depth)
+    try:
+        uids = (await client.get_units())[:limit]
+        commands = [f"ls2 {uid}" for uid in uids]
+        mismatched = 0
+        started = time.monotonic()
+        for _ in range(rounds):
+            responses = await client._make_requests(commands, PRIORITY_COMMAND)
+            mismatched += sum(not r.startswith(uid) for uid, r in zip(uids, responses))
+        elapsed = time.monotonic() - started
+    finally:
+        await client.close()
+    return len(commands) * rounds / elapsed, client.pipeline_depth, mismatched
+
+
+async def run(args):
+    sim = None
+    host, port = args.host, args.port
+    if not host:
+        sim = CoolMasterSimulator(args.units, args.latency, rtt=args.rtt, pipelining=not args.no_pipelining)
+        host, port = "127.0.0.1", await sim.start()
+
+    target = f"{host}:{port}" if sim is None else (
+        f"simulator ({args.units} units, latency {args.latency * 1000:.1f}ms, rtt {args.rtt * 1000:.1f}ms"
+        f"{', no pipelining' if args.no_pipelining else ''})")
+    print(f"Pipelining — {target}, bursts of up to {args.burst} ls2 queries × {args.rounds} rounds")
+
+    baseline = None
+    for depth in args.depths:
+        rate, final_depth, mismatched = await measure(host, port, depth, args.rounds, args.burst)
+        baseline = baseline or rate
+        note = f"  fell back to serial" if final_depth != depth else ""
+        note += f"  {mismatched} mismatched responses" if mismatched else ""
+        print(f"  depth {depth:<3} {rate:8.1f} commands/s  ×{rate / baseline:.2f}{note}")
+
+    if sim:
+        await sim.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure CoolMaster command pipelining throughput")
+    parser.add_argument("--host", help="real controller to measure; the simulator is used when omitted")
+    parser.add_argument("--port", type=int, default=10102)
+    parser.add_argument("--units", type=int, default=50, help="simulated units")
+    parser.add_argument("--latency", type=float, default=0.001, help="simulated controller turnaround, seconds")
+    parser.add_argument("--rtt", type=float, default=0.005, help="simulated network round-trip, seconds")
+    parser.add_argument("--no-pipelining", action="store_true", help="simulate a controller that can't pipeline")
+    parser.add_argument("--depths", default="1,2,4,8", help="comma-separated pipeline depths, first is the baseline")
+    parser.add_argument("--burst", type=int, default=50, help="commands per burst (at most one per unit)")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    args.depths = [int(d) for d in args.depths.split(",")]
+    asyncio.run(run(args))
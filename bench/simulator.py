@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+MODES = ["cool", "heat", "dry", "fan", "auto"]
+FAN_SPEEDS = {"l": "Low", "low": "Low", "m": "Med", "med": "Med", "medium": "Med",
+              "h": "High", "high": "High", "a": "Auto", "auto": "Auto"}
+UNITS_PER_LINE = 100
+
+
+class SimulatedUnit:
+    __slots__ = ("uid", "is_on", "setpoint", "room", "fan", "mode", "error", "demand", "modes", "fans", "limits")
+
+    def __init__(self, uid, rng):
+        self.uid = uid
+        self.is_on = rng.random() < 0.5
+        self.setpoint = float(rng.randint(18, 26))
+        self.room = round(rng.uniform(20, 30), 1)
+        self.fan = rng.choice(["Low", "Med", "High", "Auto"])
+        self.mode = "Cool"
+        self.error = "OK"
+        self.demand = 0
+        self.modes = list(MODES)
+        self.fans = ["Low", "Med", "High", "Auto"]
+        self.limits = (16, 30)
+
+    def restrict(self, modes, fans, limits):
+        """Make this a less capable unit, e.g. cooling only."""
+        self.modes, self.fans, self.limits = modes, fans, limits
+        if self.fan not in fans:
+            self.fan = fans[0]
+        self.setpoint = min(max(self.setpoint, limits[0]), limits[1])
+
+    def props(self):
+        modes = " ".join(("+" if m in self.modes else "-") + m.capitalize() for m in MODES)
+        fans = " ".join(("+" if f in self.fans else "-") + f[0] for f in ("Low", "Med", "High", "Auto"))
+        return (f"{self.uid} Name     -\r\n"
+                f"       Modes    {modes}\r\n"
+                f"       Fspeeds  {fans}\r\n"
+                f"       Limits   {self.limits[0]}-{self.limits[1]}\r\n")
+
+    def ls2_line(self):
+        # Failure code column reads OK unless faulted; the bridge strips "OK" from responses
+        return f"{self.uid} {'ON ' if self.is_on else 'OFF'} {self.setpoint:04.1f}C {self.room:04.1f}C {self.fan:<4} {self.mode:<4} {self.error:<3} - {self.demand}"
+
+
+class CoolMasterSimulator:
+    """
+    Local asyncio stand-in for a CoolMasterNet controller's ASCII interface.
+
+    Speaks the subset the bridge uses (`ls`, `ls2 [uid]`, `props`, `temp`, `on`, `off`,
+    `cool`/`heat`/`dry`/`fan`/`auto`, `fspeed`), terminating every reply with the
+    `\\n>` prompt `_make_request` reads up to. `latency` is the controller's
+    turnaround per command, `rtt` a network delay added to every reply without
+    holding up the next command, and `churn` is the fraction of units whose room
+    temperature/demand moves each second. With `pipelining=False` the controller
+    ignores anything that arrives together with the command it is working on.
+    Every 4th unit only cools (18-30°C) and every 6th has no automatic fan speed;
+    commands outside a unit's capabilities are refused, as a real controller does.
+    """
+
+    def __init__(self, units=15, latency=0.0, churn=0.0, seed=None, rtt=0.0, pipelining=True):
+        rng = random.Random(seed)
+        self.rng = rng
+        self.latency = latency
+        self.rtt = rtt
+        self.pipelining = pipelining
+        self.churn = churn
+        self.units = {}
+        for i in range(units):
+            uid = f"L{i // UNITS_PER_LINE + 1}.{i % UNITS_PER_LINE + 1:03d}"
+            self.units[uid] = unit = SimulatedUnit(uid, rng)
+            if i % 4 == 3:
+                unit.restrict(["cool", "dry", "fan"], unit.fans, (18, 30))
+            if i % 6 == 5:
+                unit.restrict(unit.modes, ["Low", "Med", "High"], unit.limits)
+
+        self.server = None
+        self.port = None
+        self.command_listener = None  # callable(verb, args, received_at, replied_at)
+        self.request_counts = {}
+        self._churn_task = None
+        self._connections = set()
+        self._handlers = set()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.churn:
+            self._churn_task = asyncio.create_task(self._churn())
+        return self.port
+
+    async def stop(self):
+        """Stop listening and drop every open connection, like a controller losing power."""
+        if self._churn_task:
+            self._churn_task.cancel()
+        if self.server:
+            self.server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        pending = b""
+        self._connections.add(writer)
+        self._handlers.add(asyncio.current_task())
+        try:
+            while True:
+                if b"\n" not in pending:
+                    chunk = await reader.read(4096)
+                    if not chunk:
+                        break
+                    pending += chunk
+                    continue
+                line, pending = pending.split(b"\n", 1)
+                if not self.pipelining:
+                    pending = b""
+                received = time.monotonic()
+                parts = line.decode(errors="replace").split()
+                if not parts:
+                    self._reply(loop, writer, b"\r\n>")
+                    continue
+
+                reply = self.execute(parts[0].lower(), parts[1:])
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                self._reply(loop, writer, (reply + "\r\n>").encode())
+                await writer.drain()
+                if self.command_listener:
+                    self.command_listener(parts[0].lower(), parts[1:], received, time.monotonic() + self.rtt)
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def _reply(self, loop, writer, data):
+        if self.rtt:
+            loop.call_later(self.rtt, lambda: writer.is_closing() or writer.write(data))
+        else:
+            writer.write(data)
+
+    def execute(self, verb, args):
+        """Apply one command to the simulated state and return its reply (without the prompt)."""
+        self.request_counts[verb] = self.request_counts.get(verb, 0) + 1
+
+        if verb in ("ls", "ls2"):
+            units = self._select(args[0] if args else None)
+            if units is None:
+                return "Unknown UID"
+            return "".join(u.ls2_line() + "\r\n" for u in units) + "OK"
+
+        unit = self.units.get(args[0]) if args else None
+        if unit is None:
+            return "Unknown UID"
+
+        if verb == "props":
+            return unit.props() + "OK"
+        if verb == "temp" and len(args) > 1:
+            try:
+                setpoint = float(args[1])
+            except ValueError:
+                return "Bad Parameter"
+            if not unit.limits[0] <= setpoint <= unit.limits[1]:
+                return "Bad Parameter"
+            unit.setpoint = setpoint
+        elif verb == "on":
+            unit.is_on = True
+        elif verb == "off":
+            unit.is_on = False
+        elif verb in MODES:
+            if verb not in unit.modes:
+                return "Unsupported Feature"
+            unit.mode = verb.capitalize()
+        elif verb == "fspeed" and len(args) > 1 and args[1].lower() in FAN_SPEEDS:
+            if FAN_SPEEDS[args[1].lower()] not in unit.fans:
+                return "Unsupported Feature"
+            unit.fan = FAN_SPEEDS[args[1].lower()]
+        else:
+            return "Unsupported Feature"
+        return "OK"
+
+    def _select(self, selector):
+        if not selector:
+            return list(self.units.values())
+        if selector in self.units:
+            return [self.units[selector]]
+        matched = [u for u in self.units.values() if u.uid.startswith(selector + ".")]  # whole line, e.g. L2
+        return matched or None
+
+    async def _churn(self):
+        units = list(self.units.values())
+        while True:
+            await asyncio.sleep(1)
+            for unit in self.rng.sample(units, max(1, int(len(units) * self.churn))):
+                unit.room = round(unit.room + self.rng.choice((-0.1, 0.1)), 1)
+                unit.demand = int(unit.is_on and unit.room > unit.setpoint)
+
+
+async def _serve(args):
+    sim = CoolMasterSimulator(args.units, args.latency, args.churn, args.seed, args.rtt, not args.no_pipelining)
+    port = await sim.start(args.host, args.port)
+    print(f"{datetime.now().strftime('%H:%M:%S')} 🧪 Simulating {args.units} units on {args.host}:{port} "
+          f"(latency {args.latency * 1000:.0f}ms, rtt {args.rtt * 1000:.0f}ms, churn {args.churn:.0%}/s)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated CoolMasterNet controller")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10102)
+    parser.add_argument("--units", type=int, default=15, help="1 to 1000")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+    parser.add_argument("--rtt", type=float, default=0.0, help="network round-trip added to every reply, seconds")
+    parser.add_argument("--churn", type=float, default=0.0, help="fraction of units changing per second")
+    parser.add_argument("--no-pipelining", action="store_true", help="drop commands sent before the previous reply")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    if not 1 <= args.units <= 1000:
+        parser.error("--units must be between 1 and 1000")
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
@@ -3,11 +3,139 @@ import os
 COOLMASTER_HOST = os.getenv("COOLMASTER_HOST", "")
 COOLMASTER_PORT = int(os.getenv("COOLMASTER_PORT", 10102))
 
+# Several controllers in one bridge: COOLMASTER_HOSTS="north=192.168.1.50,south=192.168.2.50:10102"
+# Each name prefixes its units' IDs (north.L1.001) so they don't collide. Overrides COOLMASTER_HOST.
+COOLMASTER_HOSTS = os.getenv("COOLMASTER_HOSTS", "")
+
+def _parse_controllers(spec):
+    controllers = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, address = entry.partition("=")
+        host, _, port = address.partition(":")
+        if not name.isalnum() or not host:
+            raise ValueError(f"COOLMASTER_HOSTS entry '{entry}' must look like name=host[:port] with an alphanumeric name")
+        controllers.append((name, host, int(port) if port else COOLMASTER_PORT))
+    if len({name for name, _, _ in controllers}) != len(controllers):
+        raise ValueError("COOLMASTER_HOSTS controller names must be unique")
+    return controllers
+
+# (name, host, port) per controller; a lone unnamed controller keeps the bare unit IDs
+COOLMASTER_CONTROLLERS = _parse_controllers(COOLMASTER_HOSTS) or [("", COOLMASTER_HOST, COOLMASTER_PORT)]
+
+# Commands of one burst (group commands, mode changes) kept in flight on the socket at once; 1 = one at a time.
+# A controller that stalls on pipelined input is switched back to 1 automatically.
+COOLMASTER_PIPELINE_DEPTH = int(os.getenv("COOLMASTER_PIPELINE_DEPTH", 1))
+
+# Connection supervision: reconnect delays grow from BACKOFF_INITIAL to BACKOFF_MAX seconds (jittered),
+# and a connection idle for KEEPALIVE seconds is probed so a dead socket is noticed early (0 disables)
+COOLMASTER_BACKOFF_INITIAL = float(os.getenv("COOLMASTER_BACKOFF_INITIAL", 1))
+COOLMASTER_BACKOFF_MAX = float(os.getenv("COOLMASTER_BACKOFF_MAX", 30))
+COOLMASTER_KEEPALIVE = float(os.getenv("COOLMASTER_KEEPALIVE", 30))
+
+# Group command topics: GROUP_TOPIC_PREFIX/<group>/set/<temperature|mode|fan_mode>, results on .../<group>/result
+# COOLMASTER_GROUPS="floor1=L1.*;meeting=L1.003,L1.004" (shell-style patterns on the bridge's unit IDs); "all" is built in
+COOLMASTER_GROUPS = os.getenv("COOLMASTER_GROUPS", "")
+GROUP_TOPIC_PREFIX = os.getenv("GROUP_TOPIC_PREFIX", "coolmaster/group")
+
+def _parse_groups(spec):
+    groups = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        name, _, members = entry.partition("=")
+        patterns = tuple(filter(None, (p.strip() for p in members.split(","))))
+        if not name.replace("-", "").replace("_", "").isalnum() or not patterns:
+            raise ValueError(f"COOLMASTER_GROUPS entry '{entry}' must look like name=pattern[,pattern...]")
+        if name == "all" or name in groups:
+            raise ValueError(f"COOLMASTER_GROUPS name '{name}' is reserved or repeated")
+        groups[name] = patterns
+    return groups
+
+# group name -> unit ID patterns
+COOLMASTER_GROUP_MEMBERS = _parse_groups(COOLMASTER_GROUPS)
+
 MQTT_HOST = os.getenv("MQTT_HOST", "")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", "")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", "")
 MQTT_TOPIC_PREFIX = os.getenv("MQTT_TOPIC_PREFIX", "homeassistant/climate")
 
-POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", 2))
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", 2))
+# Adaptive polling: drop to POLL_INTERVAL_MIN on activity, back off towards POLL_INTERVAL_MAX when quiet
+POLL_INTERVAL_MIN = float(os.getenv("POLL_INTERVAL_MIN", 0.5))
+POLL_INTERVAL_MAX = float(os.getenv("POLL_INTERVAL_MAX", 10))
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", 1.5))
+POLL_ACTIVE_HOLD = float(os.getenv("POLL_ACTIVE_HOLD", 10))
+POLL_REPORT_INTERVAL = float(os.getenv("POLL_REPORT_INTERVAL", 300))
 USE_BATCH_POLLING = os.getenv("USE_BATCH_POLLING", "true").lower() in ("1", "true", "yes")
+
+# Sharded polling: poll groups of units on their own schedules instead of one `ls2` of every unit.
+# "line" makes one shard per line (L1, L2, ...) with the adaptive POLL_INTERVAL; or name[:interval]=patterns;...
+# e.g. "occupied:1=L1.*,L2.001;storerooms:30=L3.*" (patterns as for groups, first match wins, a fixed
+# interval if given); units in no shard are polled in "rest". Shard starts are staggered over POLL_INTERVAL.
+POLL_SHARDS = os.getenv("POLL_SHARDS", "")
+
+def _parse_shards(spec):
+    if spec.strip().lower() == "line":
+        return "line"
+    shards = []
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        head, _, members = entry.partition("=")
+        name, _, interval = head.partition(":")
+        patterns = tuple(filter(None, (p.strip() for p in members.split(","))))
+        if not name.replace("-", "").replace("_", "").isalnum() or not patterns:
+            raise ValueError(f"POLL_SHARDS entry '{entry}' must look like name[:interval]=pattern[,pattern...]")
+        if name == "rest" or name in (n for n, _, _ in shards):
+            raise ValueError(f"POLL_SHARDS name '{name}' is reserved or repeated")
+        shards.append((name, float(interval) if interval else None, patterns))
+    return shards
+
+# "line", or [(name, interval or None, patterns)]; empty polls every unit in one cycle
+POLL_SHARD_SPEC = _parse_shards(POLL_SHARDS)
+
+# Outbound MQTT publish queue
+MQTT_QUEUE_SIZE = int(os.getenv("MQTT_QUEUE_SIZE", 10000))
+MQTT_MAX_INFLIGHT = int(os.getenv("MQTT_MAX_INFLIGHT", 20))
+MQTT_FLUSH_INTERVAL = float(os.getenv("MQTT_FLUSH_INTERVAL", 0))
+
+# Prometheus/OpenMetrics endpoint at http://METRICS_HOST:METRICS_PORT/metrics; 0 disables
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()            # "text" or "json"
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 5))            # messages per key (e.g. per unit) per window; 0 disables
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", 60))       # seconds; held-back messages are summarised per window
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", 1000))       # recent events kept for SIGUSR1 dumps; 0 disables
+LOG_BUFFER_LEVEL = os.getenv("LOG_BUFFER_LEVEL", "INFO").upper()
+
+# "json" publishes one state document per unit; "attributes" publishes only changed fields to per-attribute topics
+MQTT_PUBLISH_MODE = os.getenv("MQTT_PUBLISH_MODE", "json").lower()
+# Ignore room temperature moves smaller than this (°C) since the last published value; 0 disables
+TEMPERATURE_DEADBAND = float(os.getenv("TEMPERATURE_DEADBAND", 0))
+# Seconds after a set/* command during which newer values for the same unit and setting are coalesced
+# (slider drags); the first command of a burst is always sent at once, 0 disables coalescing
+COMMAND_DEBOUNCE = float(os.getenv("COMMAND_DEBOUNCE", 0.3))
+
+# Unit capabilities (modes, fan speeds, setpoint limits) are read with `props` at discovery and re-read
+# after CAPABILITY_TTL seconds (0: only on request), at most CAPABILITY_REFRESH_BATCH units per poll cycle.
+# Publishing a UID, a group name or "all" (empty payload) to CAPABILITY_REFRESH_TOPIC re-reads them sooner.
+CAPABILITY_TTL = float(os.getenv("CAPABILITY_TTL", 86400))
+CAPABILITY_REFRESH_BATCH = int(os.getenv("CAPABILITY_REFRESH_BATCH", 20))
+CAPABILITY_REFRESH_TOPIC = os.getenv("CAPABILITY_REFRESH_TOPIC", "coolmaster/capabilities/refresh")
+
+# Warm start: unit list, last published state and discovery hashes are saved here every SNAPSHOT_INTERVAL
+# seconds and at shutdown, and loaded at startup so a restart only publishes what really changed. Empty (the
+# default) disables; in Docker point it at a mounted volume, e.g. /data/snapshot.json
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", 60))
+
+# MQTT transport: "paho" (network thread) or "asyncio" (runs on the bridge's event loop, no thread hops).
+# MQTT_PROTOCOL=5 needs the asyncio transport and sends repeated topics as topic aliases.
+MQTT_TRANSPORT = os.getenv("MQTT_TRANSPORT", "paho").lower()
+MQTT_PROTOCOL = 5 if os.getenv("MQTT_PROTOCOL", "3.1.1") in ("5", "5.0") else 4
+
+# QoS per topic class (0 or 1); commands covers the set/* subscriptions and group results
+MQTT_QOS_STATE = int(os.getenv("MQTT_QOS_STATE", 0))
+MQTT_QOS_DISCOVERY = int(os.getenv("MQTT_QOS_DISCOVERY", 0))
+MQTT_QOS_AVAILABILITY = int(os.getenv("MQTT_QOS_AVAILABILITY", 1))
+MQTT_QOS_COMMANDS = int(os.getenv("MQTT_QOS_COMMANDS", 1))
@@ -0,0 +1 @@
+# Lets `pytest` import the bridge's top-level modules (config, metrics, ...) from the repository root
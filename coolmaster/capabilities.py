@@ -0,0 +1,155 @@
+import re
+import time
+
+# `props` spellings -> the bridge's mode / fan speed names
+_PROPS_MODES = {"cool": "cool", "heat": "heat", "dry": "dry", "fan": "fan", "auto": "auto"}
+_PROPS_FAN_SPEEDS = {"l": "low", "low": "low", "m": "medium", "med": "medium", "medium": "medium",
+                     "h": "high", "high": "high", "a": "auto", "auto": "auto"}
+_RANGE = re.compile(r"(\d+(?:\.\d+)?)\s*-\s*(\d+(?:\.\d+)?)")
+
+
+class UnitCapabilities:
+    """
+    What one indoor unit accepts: HVAC modes (besides "off"), fan speeds and setpoint limits.
+
+    `fetched_at` is the wall-clock time the controller was asked (0 for the built-in
+    defaults), so the cache's TTL survives a restart through the snapshot.
+    """
+
+    __slots__ = ("modes", "fan_speeds", "min_temp", "max_temp", "fetched_at")
+
+    def __init__(self, modes, fan_speeds, min_temp, max_temp, fetched_at=0.0):
+        self.modes = tuple(modes)
+        self.fan_speeds = tuple(fan_speeds)
+        self.min_temp = min_temp
+        self.max_temp = max_temp
+        self.fetched_at = fetched_at
+
+    def __repr__(self):
+        return (f"UnitCapabilities(modes={self.modes}, fan_speeds={self.fan_speeds}, "
+                f"temp={self.min_temp}-{self.max_temp})")
+
+    def __eq__(self, other):
+        return isinstance(other, UnitCapabilities) and self.values() == other.values()
+
+    def values(self):
+        """The capabilities themselves, without the fetch time."""
+        return self.modes, self.fan_speeds, self.min_temp, self.max_temp
+
+    def check(self, command_type, value):
+        """Raise ValueError if the unit would reject `command_type` = `value`."""
+        value = value.strip().lower()
+        if command_type == "temperature":
+            setpoint = float(value)
+            if not self.min_temp <= setpoint <= self.max_temp:
+                raise ValueError(f"setpoint {value} outside {self.min_temp:g}-{self.max_temp:g}")
+        elif command_type == "mode" and value != "off" and value not in self.modes:
+            raise ValueError(f"unsupported mode '{value}'")
+        elif command_type == "fan_mode" and value not in self.fan_speeds:
+            raise ValueError(f"unsupported fan_mode '{value}'")
+
+    def to_list(self):
+        return [list(self.modes), list(self.fan_speeds), self.min_temp, self.max_temp, self.fetched_at]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+
+# Used until a unit has answered `props`, and for controllers that don't support it
+DEFAULT = UnitCapabilities(("cool", "auto", "heat", "dry", "fan"), ("low", "medium", "high", "auto"), 16, 28)
+
+
+def _flags(tokens, names):
+    """Supported names from `+Cool -Heat Dry` style tokens; a leading "-" marks an unsupported one."""
+    supported = []
+    for token in tokens:
+        if token.startswith("-"):
+            continue
+        name = names.get(token.lstrip("+").lower())
+        if name and name not in supported:
+            supported.append(name)
+    return supported
+
+
+def parse_props(text, fetched_at=None):
+    """
+    Capabilities from a `props <uid>` response, or None if it has none of the fields
+    (an error reply, or a controller without the command).
+
+    Lines are `<key> <values>`, optionally prefixed by the UID and with a colon after the key:
+    `Modes +Cool +Heat -Auto`, `Fspeeds +L +M +H -A`, `Limits 16-30` (per-mode ranges are
+    widened into one). Fields that are missing keep the defaults.
+    """
+    modes = fan_speeds = limits = None
+    for line in text.splitlines():
+        tokens = line.replace(":", " ").split()
+        if tokens and "." in tokens[0]:  # leading UID
+            tokens = tokens[1:]
+        if not tokens:
+            continue
+        key, values = tokens[0].lower(), tokens[1:]
+        if key.startswith("mode"):
+            modes = [m for m in DEFAULT.modes if m in _flags(values, _PROPS_MODES)]
+        elif key.startswith(("fspeed", "fan")):
+            fan_speeds = [f for f in DEFAULT.fan_speeds if f in _flags(values, _PROPS_FAN_SPEEDS)]
+        elif key.startswith(("limit", "temp")):
+            ranges = [(float(lo), float(hi)) for lo, hi in _RANGE.findall(" ".join(values))]
+            limits = (min(lo for lo, _ in ranges), max(hi for _, hi in ranges)) if ranges else None
+
+    if modes is None and fan_speeds is None and limits is None:
+        return None
+    min_temp, max_temp = limits or (DEFAULT.min_temp, DEFAULT.max_temp)
+    return UnitCapabilities(
+        DEFAULT.modes if modes is None else modes,
+        DEFAULT.fan_speeds if fan_speeds is None else fan_speeds,
+        min_temp, max_temp,
+        time.time() if fetched_at is None else fetched_at,
+    )
+
+
+class CapabilityCache:
+    """
+    Capabilities per unit, each re-read from the controller once it is `ttl` seconds
+    old (0 keeps them until `invalidate`). Units not read yet get DEFAULT.
+    """
+
+    def __init__(self, ttl=86400.0):
+        self.ttl = ttl
+        self._units = {}  # uid -> UnitCapabilities
+
+    def __len__(self):
+        return len(self._units)
+
+    def get(self, uid):
+        return self._units.get(uid, DEFAULT)
+
+    def stale(self, uids):
+        """The units among `uids` that were never read, were invalidated or have outlived the TTL."""
+        now = time.time()
+        stale = []
+        for uid in uids:
+            caps = self._units.get(uid)
+            if caps is None or not caps.fetched_at or (self.ttl and now - caps.fetched_at >= self.ttl):
+                stale.append(uid)
+        return stale
+
+    def store(self, uid, caps):
+        """Cache `caps` for `uid`; True if they differ from what discovery was built with."""
+        previous = self._units.get(uid, DEFAULT)
+        self._units[uid] = caps
+        return caps != previous
+
+    def invalidate(self, uids=None):
+        """Have `uids` (or every unit) re-read, keeping the current values until then."""
+        for uid in self._units if uids is None else uids:
+            caps = self._units.get(uid)
+            if caps is not None:
+                caps.fetched_at = 0.0
+
+    def dump(self):
+        return {uid: caps.to_list() for uid, caps in self._units.items()}
+
+    def load(self, rows):
+        for uid, values in rows.items():
+            self._units[uid] = UnitCapabilities.from_list(values)
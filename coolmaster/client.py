@@ -1,61 +1,431 @@
 import asyncio
-import re
+import heapq
+import itertools
+import logging
 import socket
-from datetime import datetime
+import time
+from collections import deque
+
+import metrics
+from coolmaster.supervisor import Backoff, ConnectionSupervisor
+from coolmaster.unit_state import UnitState, round_temperature
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_COMMAND = 0  # set/* commands from MQTT
+PRIORITY_POLL = 1     # ls / ls2 polling
+
+PROMPT = b">"
+_NOT_SENT = object()  # result of a command a partial request never got to (see _Request.partial)
+_POWER = {b"ON": True, b"OFF": False}
+_FAN_MODES = {b"med": "medium"}  # controller spelling -> HA fan mode; filled lazily with lowercase passthroughs
+_HVAC_MODES = {}                  # raw mode token -> lowercase mode, filled lazily
+_SETPOINTS = {}                   # raw "24.5C" token -> 24.5, filled lazily (a handful of distinct values per site)
+
+HVAC_MODES = ("cool", "auto", "heat", "dry", "fan")
+FAN_SPEEDS = ("low", "medium", "high", "auto")
+
+
+def _lookup(table, token, convert):
+    value = table.get(token)
+    if value is None:
+        value = table[token] = convert(token)
+    return value
+
+
+def parse_ls2_line(line: bytes):
+    """Parse one ls2 line into a UnitState, or None if it isn't a unit line."""
+    # Dropping the "OK" failure-code token keeps the column layout the bridge has always parsed
+    fields = [f for f in line.split() if f != b"OK"]
+    if len(fields) < 8:
+        return None
+
+    error_field = fields[6]
+    has_error = error_field != b"-"
+    return UnitState(
+        fields[0].decode(),
+        _POWER.get(fields[1], False),
+        _lookup(_SETPOINTS, fields[2], lambda t: round_temperature(float(t[:-1]))),
+        round_temperature(float(fields[3][:-1])),
+        _lookup(_FAN_MODES, fields[4].lower(), bytes.decode),
+        _lookup(_HVAC_MODES, fields[5], lambda t: t.decode().lower()),
+        error_field.decode() if has_error else "OK",
+        has_error,
+        "cooling" if fields[-1] == b"1" else "idle",
+    )
+
+
+def unit_commands(uid, command_type, value, current=None, capabilities=None):
+    """
+    The controller commands that take `uid` to the requested state.
+    Parts already satisfied by `current` (the unit's last known UnitState) are left out,
+    so the list can be empty. Raises ValueError for values the controller would reject,
+    including those outside the unit's `capabilities` when given.
+    """
+    if capabilities is not None:
+        capabilities.check(command_type, value)
+    value = value.strip().lower()
+    if command_type == "temperature":
+        setpoint = round_temperature(float(value))
+        return [] if current and current.thermostat == setpoint else [f"temp {uid} {value}"]
+    if command_type == "mode" and value == "off":
+        return [] if current and not current.is_on else [f"off {uid}"]
+    if command_type == "mode" and value in HVAC_MODES:
+        commands = [] if current and current.is_on else [f"on {uid}"]
+        if not (current and current.hvac_mode == value):
+            commands.append(f"{value} {uid}")
+        return commands
+    if command_type == "fan_mode" and value in FAN_SPEEDS:
+        return [] if current and current.fan_mode == value else [f"fspeed {uid} {value}"]
+    raise ValueError(f"unsupported {command_type} '{value}'")
+
+
+def expected_state(state, command_type, value):
+    """A copy of `state` as the unit should be once `command_type` = `value` has been applied."""
+    expected = state.copy()
+    value = value.strip().lower()
+    if command_type == "temperature":
+        expected.thermostat = round_temperature(float(value))
+    elif command_type == "mode" and value == "off":
+        expected.is_on = False
+    elif command_type == "mode":
+        expected.is_on = True
+        expected.hvac_mode = value
+    elif command_type == "fan_mode":
+        expected.fan_mode = value
+    return expected
+
+
+def _clean(response: bytes):
+    """Response body as text, with the "OK" acknowledgements removed (a plain success becomes "")."""
+    return response.decode(errors="replace").strip().strip(">").replace("OK", "").strip()
+
+
+class _Request:
+    """One queued unit of work for the socket: a burst of commands sent back-to-back."""
+
+    __slots__ = ("priority", "commands", "uid", "future", "line_handler", "partial", "enqueued_at")
+
+    def __init__(self, priority, commands, uid, future, line_handler=None, partial=False):
+        self.priority = priority
+        self.commands = commands
+        self.uid = uid
+        self.future = future
+        self.line_handler = line_handler
+        self.partial = partial  # on failure, resolve with per-command outcomes instead of raising
+        self.enqueued_at = time.monotonic()
+
+    def finish(self, results, error=None):
+        """
+        Resolve the future with `results`, one per command so far. A failure fails the whole
+        request, unless it is `partial`: then the error takes the failed command's place and
+        the commands after it are _NOT_SENT.
+        """
+        if self.future.done():
+            return
+        if error is None:
+            self.future.set_result(results)
+        elif self.partial:
+            self.future.set_result(results + [error] + [_NOT_SENT] * (len(self.commands) - len(results) - 1))
+        else:
+            self.future.set_exception(error)
+
 
 class CoolMasterClient:
-    def __init__(self, host, port=10102, timeout=3):
+    def __init__(self, host, port=10102, timeout=3, name="", pipeline_depth=1, keepalive=30.0, backoff=(1.0, 30.0)):
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.name = name or host  # metrics label
         self.reader = None
         self.writer = None
-        self.lock = asyncio.Lock()
+        self._rx = b""  # received bytes not yet consumed; may run into the next pipelined response
+
+        # Commands of one burst kept in flight at once; 1 is strictly one command per round-trip.
+        # Drops to 1 for good if the controller stalls on pipelined input.
+        self.pipeline_depth = max(1, pipeline_depth)
+        self._pipeline_verified = False  # probed on this connection, see _probe_pipeline
+
+        # Reconnect pacing, keepalive probes and availability reporting
+        self.supervisor = ConnectionSupervisor(self, keepalive, Backoff(*backoff))
+
+        # Prioritised scheduler: a single worker owns the socket and always takes
+        # control commands ahead of queued poll traffic.
+        self._heap = []
+        self._seq = itertools.count()
+        self._has_work = asyncio.Event()
+        self._worker = None
+        self._closed = False
+        self._lines = {}         # uid bytes -> (raw ls2 line, parsed status) from the last time it was read
 
     async def _ensure_connected(self):
         """Ensure the Telnet connection is open and valid."""
         try:
             if self.writer is None or self.writer.is_closing():
-                print(f"{datetime.now().strftime('%H:%M:%S')}🔌 Connecting to CoolMasterNet at {self.host}:{self.port}...")
-                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
-                print(f"{datetime.now().strftime('%H:%M:%S')} ✅ CoolMasterNet connected")
-        except (OSError, socket.gaierror) as e:
-            raise ConnectionError(f"{datetime.now().strftime('%H:%M:%S')} ❌ Failed to connect to CoolMasterNet: {e}")
-
-    async def _make_request(self, command):
-        """Send a command and return the cleaned response, retrying on connection failure."""
+                logger.info("🔌 Connecting to CoolMasterNet at %s:%s...", self.host, self.port)
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), timeout=self.timeout
+                )
+                self._rx = b""
+                self._enable_tcp_keepalive()
+                logger.info("✅ CoolMasterNet connected")
+        except (OSError, socket.gaierror, asyncio.TimeoutError) as e:
+            raise ConnectionError(f"❌ Failed to connect to CoolMasterNet: {e or 'timed out'}")
+
+    def _enable_tcp_keepalive(self):
+        """Let the OS notice a dead peer on an idle socket too (half-open after a controller power cut)."""
+        sock = self.writer.get_extra_info("socket")
+        if sock is None:
+            return
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    async def _make_request(self, command, priority=PRIORITY_POLL, line_handler=None):
+        """
+        Queue a command and return the cleaned response.
+        With a `line_handler`, each response line is handed over (as bytes) as soon as it arrives instead.
+        """
+        uid = command.split()[1] if priority == PRIORITY_COMMAND and len(command.split()) > 1 else None
+        return (await self._make_requests([command], priority, uid, line_handler))[0]
+
+    async def _make_requests(self, commands, priority=PRIORITY_POLL, uid=None, line_handler=None, partial=False):
+        """
+        Queue a burst of commands that go out back-to-back; returns their responses in order.
+        With `partial`, a failure doesn't raise: it is returned in its command's place, followed by
+        _NOT_SENT for the commands that never went out.
+        """
+        if self._closed:
+            raise ConnectionError(f"❌ Connection to {self.name} is closed")
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+            self.supervisor.start()
+
+        future = asyncio.get_running_loop().create_future()
+        request = _Request(priority, commands, uid, future, line_handler, partial)
+        heapq.heappush(self._heap, (priority, next(self._seq), request))
+        self._has_work.set()
+        return await future
+
+    async def _run(self):
+        """Worker: drain the request heap in priority order, one socket exchange at a time."""
         while True:
-            async with self.lock:
-                try:
-                    await self._ensure_connected()
-                    self.writer.write((command + "\n").encode())
-                    await self.writer.drain()
-
-                    response = await asyncio.wait_for(self.reader.readuntil(b"\n>"), timeout=self.timeout)
-                    text = response.decode().strip().strip(">").replace("OK", "").strip()
-                    return text
-
-                except asyncio.TimeoutError:
-                    raise TimeoutError(f"❌ Timeout waiting for response to command: {command}")
-
-                except (ConnectionResetError, BrokenPipeError):
-                    print(f"{datetime.now().strftime('%H:%M:%S')} ⚠️ Connection lost, retrying immediately...")
-                    await self._reset_connection()
-                    continue
+            if not self._heap:
+                self._has_work.clear()
+                await self._has_work.wait()
+                continue
 
-                except ConnectionError as e:
-                    print(f"{datetime.now().strftime('%H:%M:%S')} ❌ Connection error: {e}")
-                    await self._reset_connection()
-                    print(f"{datetime.now().strftime('%H:%M:%S')} ⏳ Waiting 10 seconds before retrying...")
-                    await asyncio.sleep(10)
+            _, _, request = heapq.heappop(self._heap)
+            burst = [request]
+            if request.priority == PRIORITY_COMMAND and request.uid:
+                burst += self._take_unit_commands(request.uid)
+
+            try:
+                if self.pipeline_depth > 1 and sum(len(req.commands) for req in burst) > 1:
+                    await self._execute_pipelined(burst)
                     continue
+                for req in burst:
+                    await self._execute(req)
+            except Exception as e:
+                # A bug must not take the worker down with it: every later request would hang.
+                # Replies of this burst may still be in flight, so start over on a fresh connection.
+                logger.error("❌ %s: request failed unexpectedly: %r", self.name, e)
+                for req in burst:
+                    req.finish([], e)
+                await self._reset_connection()
+
+    def _take_unit_commands(self, uid):
+        """Pull any other queued commands for the same unit so they follow in the same burst."""
+        taken = [entry for entry in self._heap if entry[2].priority == PRIORITY_COMMAND and entry[2].uid == uid]
+        if taken:
+            self._heap = [entry for entry in self._heap if entry not in taken]
+            heapq.heapify(self._heap)
+        return [entry[2] for entry in sorted(taken)]
+
+    async def _execute(self, request):
+        if request.future.done():  # caller gave up (cancelled) while queued
+            return
+
+        self._forget_unit(request)
+        started = time.monotonic()
+        queue_wait = started - request.enqueued_at
+        results = []
+        try:
+            for command in request.commands:
+                sent = time.monotonic()
+                results.append(await self._send(command, request.line_handler))
+                self._record_timing(command, queue_wait, time.monotonic() - sent, request.priority)
+        except Exception as e:
+            request.finish(results, e)
+            return
+
+        request.finish(results)
+
+    def _forget_unit(self, request):
+        if request.priority == PRIORITY_COMMAND and request.uid:
+            # The unit is about to change: make the next poll re-read it even if its line looks the same
+            self.reread((request.uid,))
+
+    def reread(self, uids):
+        """Have the next poll report these units as changed, even if their ls2 line is the same."""
+        for uid in uids:
+            self._lines.pop(uid.encode(), None)
+
+    async def _execute_pipelined(self, burst):
+        """
+        Run a burst with up to `pipeline_depth` commands in flight, matching responses to
+        commands in order by their prompts. Whatever the pipeline did not get answered
+        (connection lost, controller stalled) is finished one command at a time.
+        """
+        burst = [req for req in burst if not req.future.done()]
+        for req in burst:
+            self._forget_unit(req)
+        queue = [(req, command) for req in burst for command in req.commands]
+        results = {req: [] for req in burst}
+
+        answered = await self._pipeline(queue, results)
+
+        failed = set()
+        for req, command in queue[answered:]:
+            if req in failed:
+                continue
+            try:
+                sent = time.monotonic()
+                results[req].append(await self._send(command, req.line_handler))
+                self._record_timing(command, sent - req.enqueued_at, time.monotonic() - sent, req.priority)
+            except Exception as e:
+                failed.add(req)
+                req.finish(results[req], e)
+
+        for req in burst:
+            if req not in failed:
+                req.finish(results[req])
+
+    async def _pipeline(self, queue, results):
+        """Send `queue` [(request, command), ...] pipelined; returns how many were answered."""
+        answered = written = 0
+        sent_at = deque()
+        try:
+            await self._ensure_connected()
+            if not self._pipeline_verified:
+                await self._probe_pipeline()
+            while answered < len(queue):
+                while written < len(queue) and written - answered < self.pipeline_depth:
+                    self.writer.write((queue[written][1] + "\n").encode())
+                    sent_at.append(time.monotonic())
+                    written += 1
+                await self.writer.drain()
+
+                req, command = queue[answered]
+                response = await asyncio.wait_for(self._read_response(req.line_handler), timeout=self.timeout)
+                self.supervisor.succeeded()
+                results[req].append(_clean(response))
+                sent = sent_at.popleft()
+                self._record_timing(command, sent - req.enqueued_at, time.monotonic() - sent, req.priority)
+                answered += 1
+
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ %s did not answer pipelined commands in time, switching to one command at a time", self.name)
+            self.pipeline_depth = 1
+            await self._reset_connection()
+
+        except (ConnectionError, OSError) as e:
+            logger.warning("⚠️ Connection lost mid-pipeline (%s), finishing %d commands one at a time", e, len(queue) - answered)
+            await self.supervisor.failed(e, retry=False)
+
+        return answered
+
+    def _record_timing(self, command, queue_wait, wire, priority):
+        verb = command.split()[0]
+        metrics.QUEUE_WAIT_SECONDS.observe(queue_wait, controller=self.name, verb=verb)
+        metrics.REQUEST_SECONDS.observe(wire, controller=self.name, verb=verb)
+
+        if priority == PRIORITY_COMMAND:
+            logger.debug("⏱️ '%s' queued %.0fms, wire %.0fms", command, queue_wait * 1000, wire * 1000)
+
+    async def _probe_pipeline(self):
+        """
+        Write `pipeline_depth` read-only queries in one go and expect as many prompts back.
+        A controller that drops input while busy would otherwise shift every later response
+        onto the wrong command; here it just times out before any real command is at stake.
+        """
+        self.writer.write((self._probe_command() + "\n").encode() * self.pipeline_depth)
+        await self.writer.drain()
+        for _ in range(self.pipeline_depth):
+            await asyncio.wait_for(self._read_response(), timeout=self.timeout)
+        self._pipeline_verified = True
+
+    def _probe_command(self):
+        """A cheap read-only query: one known unit's ls2 line, or ls before any unit is known."""
+        known = next(iter(self._lines), None)
+        return f"ls2 {known.decode()}" if known else "ls"
+
+    async def ping(self):
+        """Keepalive round-trip; a missing reply is handled like any other failed exchange."""
+        await self._make_request(self._probe_command(), PRIORITY_POLL, lambda line: None)
+
+    async def _send(self, command, line_handler=None):
+        """Send a command and return the cleaned response, reconnecting with backoff on connection failure."""
+        while True:
+            try:
+                await self._ensure_connected()
+                self.writer.write((command + "\n").encode())
+                await self.writer.drain()
+
+                response = await asyncio.wait_for(self._read_response(line_handler), timeout=self.timeout)
+                self.supervisor.succeeded()
+                return _clean(response)
+
+            except asyncio.TimeoutError:
+                # A stalled controller or a half-open socket; either way the reply stream is out of step now
+                await self.supervisor.failed(f"no reply to '{command}' within {self.timeout}s", retry=False)
+                raise TimeoutError(f"❌ Timeout waiting for response to command: {command}")
+
+            except (ConnectionError, OSError) as e:
+                await self.supervisor.failed(e)
+                continue
+
+            except Exception as e:
+                raise RuntimeError(f"❌ Unexpected error during command '{command}': {e}")
+
+    async def _read_response(self, line_handler=None):
+        """
+        Consume one response, up to its "\\n>" prompt, and return its body.
+        Bytes after the prompt are the start of the next (pipelined) response and stay buffered.
+        With a `line_handler`, complete lines are handed over as chunks arrive and b"" is returned.
+        """
+        while True:
+            end = self._rx.find(b"\n" + PROMPT)
+            if end >= 0:
+                body, self._rx = self._rx[:end], self._rx[end + 1 + len(PROMPT):]
+                if line_handler is None:
+                    return body
+                self._feed_lines(body, line_handler)
+                return b""
+
+            if line_handler is not None:
+                cut = self._rx.rfind(b"\n")
+                if cut > 0:
+                    # Keep the newline: the prompt that follows is only recognised after one
+                    self._feed_lines(self._rx[:cut], line_handler)
+                    self._rx = self._rx[cut:]
 
-                except Exception as e:
-                    raise RuntimeError(f"❌ Unexpected error during command '{command}': {e}")
+            chunk = await self.reader.read(65536)
+            if not chunk:
+                raise ConnectionResetError("connection closed mid-response")
+            self._rx += chunk
 
+    @staticmethod
+    def _feed_lines(data, line_handler):
+        for line in data.split(b"\n"):
+            line = line.rstrip(b"\r")
+            if line:
+                line_handler(line)
 
     async def _reset_connection(self):
         """Tear down and rebuild the connection."""
+        metrics.RECONNECTS.inc(controller=self.name)
         if self.writer:
             try:
                 self.writer.close()
@@ -64,10 +434,21 @@ class CoolMasterClient:
                 pass
         self.reader = None
         self.writer = None
-        await asyncio.sleep(1)
+        self._rx = b""
+        self._pipeline_verified = False
+        self._lines.clear()  # units may have changed while the connection was down
 
     async def close(self):
-        """Cleanly close the Telnet connection."""
+        """Stop the request worker, fail whatever is still queued and cleanly close the Telnet connection."""
+        self._closed = True
+        self.supervisor.stop()
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        for _, _, request in self._heap:
+            if not request.future.done():
+                request.future.set_exception(ConnectionError(f"❌ Connection to {self.name} is closed"))
+        self._heap = []
         if self.writer:
             self.writer.close()
             await self.writer.wait_closed()
@@ -77,96 +458,138 @@ class CoolMasterClient:
         raw = await self._make_request("ls")
         return [line.split()[0] for line in raw.splitlines() if line]
         
-    async def get_status(self, uid: str = None):
+    async def get_properties(self, uids):
+        """{uid: cleaned `props <uid>` response}, asked as one burst at poll priority."""
+        responses = await self._make_requests([f"props {uid}" for uid in uids])
+        return dict(zip(uids, responses))
+
+    async def get_status(self, uid: str = None, priority=PRIORITY_POLL):
         """
         Get status for a single UID or all units.
         If `uid` is provided, runs `ls2 {uid}`, otherwise `ls2`.
         Returns:
-            - dict of {uid: status_dict} if `uid` is None
-            - status_dict directly if `uid` is provided
+            - dict of {uid: UnitState} if `uid` is None
+            - UnitState directly if `uid` is provided
+        Pass `priority=PRIORITY_COMMAND` for a post-command refresh that should skip the poll queue.
+        Records are shared with the line cache; copy before modifying.
         """
-        command = f"ls2 {uid}" if uid else "ls2"
-        raw = await self._make_request(command)
-        lines = raw.strip().splitlines()
-
-        # Handle single line for individual unit
-        if uid:
-            lines = [raw.strip()]
+        units, _ = await self._read_status([f"ls2 {uid}" if uid else "ls2"], priority)
+        return units[uid] if uid else units
 
-        units = {}
+    async def get_changed_status(self, priority=PRIORITY_POLL, selectors=None):
+        """
+        Run `ls2` and return {uid: UnitState} for only the units whose line changed since it was last read.
+        With `selectors` (lines like "L1" or unit IDs), only those are read, as one `ls2 <selector>` burst.
+        """
+        commands = [f"ls2 {selector}" for selector in selectors] if selectors is not None else ["ls2"]
+        _, changed = await self._read_status(commands, priority)
+        return changed
 
-        for line in lines:
-            fields = re.split(r"\s+", line.strip())
-            if len(fields) < 8:
-                print(f"⚠️ Skipping malformed line: {line}")
-                continue
+    async def _read_status(self, commands, priority):
+        """
+        Stream ls2 responses through the parser; lines identical to last time reuse their parsed status.
+        New lines only enter the cache once every response has been read: after a timeout or a dropped
+        connection partway through, the units already read must still count as changed next time.
+        """
+        units, changed, seen = {}, {}, {}
+        cache = self._lines
 
-            unit_id = fields[0]
+        def on_line(line):
+            key = line.split(None, 1)[0] if line else b""
+            cached = cache.get(key)
+            if cached is not None and cached[0] == line:
+                units[cached[1].uid] = cached[1]
+                return
+            if not line or line == b"OK":
+                return
             try:
-                error_field = fields[6]
-                if error_field == "-":
-                    error_status = "OK"
-                    has_error = False
-                else:
-                    error_status = error_field
-                    has_error = True
-
-                hvac_state = "cooling" if fields[-1] == "1" else "idle"
-
-                fan_mode_map = {"med": "medium",}#added to handle HA
-
-                unit_data = {
-                    "uid": unit_id,
-                    "is_on": fields[1] == "ON",
-                    "thermostat": float(fields[2][:-1]),
-                    "temperature": float(fields[3][:-1]),
-                    "fan_mode": fan_mode_map.get(fields[4].lower(), fields[4].lower()),
-                    "hvac_mode": fields[5].lower(),
-                    "status": error_status,
-                    "has_error": has_error,
-                    "state": hvac_state,
-                }
-
-                units[unit_id] = unit_data
-
+                unit = parse_ls2_line(line)
             except Exception as e:
-                print(f"❌ Error parsing line for {unit_id}: {e}")
+                logger.warning("❌ Error parsing line for %s: %s", key.decode(errors="replace"), e,
+                               extra={"rate_key": "ls2 parse errors"})
+                return
+            if unit is None:
+                logger.warning("⚠️ Skipping malformed line: %r", line, extra={"rate_key": "malformed ls2 lines"})
+                return
+            seen[key] = (line, unit)
+            units[unit.uid] = changed[unit.uid] = unit
+
+        await self._make_requests(commands, priority, line_handler=on_line)
+        cache.update(seen)
+        return units, changed
+
+    async def send_batch(self, batch):
+        """
+        Send several units' commands as one burst at command priority: a single queue entry,
+        so no poll interleaves and the socket goes straight from one command to the next.
+        `batch` is [(uid, [command, ...]), ...]; returns {uid: None on success, else the error}.
+        A failure partway (timeout, lost connection) is reported only for its own unit: units
+        before it keep their outcome, and those after it are reported as "not sent".
+        """
+        for uid, _ in batch:
+            self._lines.pop(uid.encode(), None)
+        commands = [command for _, sent in batch for command in sent]
+        try:
+            responses = await self._make_requests(commands, PRIORITY_COMMAND, partial=True)
+        except Exception as e:
+            return {uid: str(e) for uid, _ in batch}
+
+        # Success is a bare "OK" (cleaned to ""); anything else is the controller's complaint
+        results, i = {}, 0
+        for uid, sent in batch:
+            outcomes = responses[i:i + len(sent)]
+            i += len(sent)
+            if outcomes[0] is _NOT_SENT:
+                results[uid] = "not sent"
                 continue
+            results[uid] = "; ".join(str(r) for r in outcomes if r and r is not _NOT_SENT) or None
+        return results
 
-        return units[uid] if uid else units
-  
+    async def send_command(self, uid, command_type, value, current=None):
+        """
+        Send what it takes to bring `uid` to `command_type` = `value` as one burst at command
+        priority, leaving out whatever `current` (its last known UnitState) already satisfies.
+        Raises if the controller refuses any of it.
+        """
+        commands = unit_commands(uid, command_type, value, current)
+        if not commands:
+            return
+        logger.info("🎛️ %s %s → %s: %s", uid, command_type, value, ", ".join(commands))
+        responses = await self._make_requests(commands, PRIORITY_COMMAND, uid)
+        errors = [response for response in responses if response]
+        if errors:
+            raise RuntimeError("; ".join(errors))
 
     async def set_thermostat(self, uid: str, value: float):
         try:
-            print(f"{datetime.now().strftime('%H:%M:%S')} 🌡️ Setting {uid} setpoint to {value}°C")
-            await self._make_request(f"temp {uid} {value}")
+            logger.info("🌡️ Setting %s setpoint to %s°C", uid, value)
+            await self._make_request(f"temp {uid} {value}", PRIORITY_COMMAND)
         except Exception as e:
-            print(f"❌ Failed to set temperature for {uid}: {e}")
+            logger.error("❌ Failed to set temperature for %s: %s", uid, e)
 
     async def set_mode(self, uid: str, mode: str):
         try:
             if mode.lower() == "off":
-                print(f"{datetime.now().strftime('%H:%M:%S')} ❄️ Turning OFF {uid}")
-                await self._make_request(f"off {uid}")
-            elif mode.lower() in ["cool", "auto", "heat", "dry", "fan"]:
-                print(f"{datetime.now().strftime('%H:%M:%S')} ❄️ Setting {uid} mode to {mode}")
+                logger.info("❄️ Turning OFF %s", uid)
+                await self._make_request(f"off {uid}", PRIORITY_COMMAND)
+            elif mode.lower() in HVAC_MODES:
+                logger.info("❄️ Setting %s mode to %s", uid, mode)
                 #ensure unit is turned on in addition to setting the mode to cool/auto/heat etc.
-                await self._make_request(f"on {uid}")
-                await self._make_request(f"{mode.lower()} {uid}")
+                #both go out as one burst so no poll can slip in between
+                await self._make_requests([f"on {uid}", f"{mode.lower()} {uid}"], PRIORITY_COMMAND, uid)
             else:
-                print(f"⚠️ Ignoring unknown mode '{mode}' for {uid}")
+                logger.warning("⚠️ Ignoring unknown mode '%s' for %s", mode, uid)
         except Exception as e:
-            print(f"❌ Failed to set mode for {uid}: {e}")
+            logger.error("❌ Failed to set mode for %s: %s", uid, e)
 
     async def set_fan_speed(self, uid: str, speed: str):
         try:
-            valid_speeds = ["low", "medium", "high", "auto"]
-            if speed.lower() not in valid_speeds:
-                print(f"⚠️ Invalid fan speed '{speed}' for {uid}")
+            if speed.lower() not in FAN_SPEEDS:
+                logger.warning("⚠️ Invalid fan speed '%s' for %s", speed, uid)
                 return
-            print(f"{datetime.now().strftime('%H:%M:%S')} 💨 Setting {uid} fan speed to {speed}")
-            await self._make_request(f"fspeed {uid} {speed.lower()}")
+            logger.info("💨 Setting %s fan speed to %s", uid, speed)
+            await self._make_request(f"fspeed {uid} {speed.lower()}", PRIORITY_COMMAND)
             
         except Exception as e:
-            print(f"❌ Failed to set fan speed for {uid}: {e}")
+            logger.error("❌ Failed to set fan speed for %s: %s", uid, e)
 
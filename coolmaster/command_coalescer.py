@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import metrics
+from coolmaster.client import expected_state, unit_commands
+
+
+class _Recent:
+    __slots__ = ("generation", "sent", "state", "until", "waiting")
+
+    def __init__(self):
+        self.generation = 0   # bumped by every command, so a waiting one can tell it was replaced
+        self.sent = None      # the last value sent
+        self.state = None     # the UnitState the unit should be in after it, if its state was known
+        self.until = 0.0      # end of the window opened by the last send
+        self.waiting = False  # a trailing command is holding for the window to close
+
+
+class CommandCoalescer:
+    """
+    Debounce in front of the controller, per unit and command type.
+
+    The first command in a while goes out straight away and opens a `window`
+    seconds long. Commands arriving within it wait for it to close, and only the
+    newest of them is sent (last write wins), opening the next window. So a single
+    tap costs no latency, while a slider drag is sent once at its start and once
+    where it stops. A command that would change nothing, measured against the unit's
+    last known state or, for held commands, the state the last send put it in, never
+    reaches the wire.
+    """
+
+    def __init__(self, window, send):
+        self.window = window
+        self.send = send    # async callable(uid, command_type, value, current)
+        self._recent = {}   # (uid, command_type) -> _Recent
+
+    async def submit(self, uid, command_type, value, current=None):
+        """
+        Queue a command; `current` is the unit's last known UnitState before this command.
+        Returns True once the command has been sent, False if a newer value replaced it
+        or the unit is already in the requested state.
+        """
+        recent = self._recent.setdefault((uid, command_type), _Recent())
+        recent.generation += 1
+        generation = recent.generation
+
+        now = time.monotonic()
+        if now >= recent.until and not recent.waiting:
+            # Leading edge: nothing sent for this unit and setting within the window
+            if self._is_noop(uid, command_type, value, current):
+                return self._skip("unchanged")
+            return await self._send(recent, uid, command_type, value, current)
+
+        recent.waiting = True
+        await asyncio.sleep(max(0.0, recent.until - now))
+        if recent.generation != generation:
+            return self._skip("superseded")
+        recent.waiting = False
+        # `current` is only the optimistic state of whatever came before this command, which may
+        # never have been sent; the unit itself is where the last send left it
+        if self._same(command_type, value, recent.sent) or self._is_noop(uid, command_type, value, recent.state):
+            return self._skip("unchanged")
+        return await self._send(recent, uid, command_type, value, recent.state)
+
+    async def _send(self, recent, uid, command_type, value, current):
+        recent.sent = value
+        recent.state = expected_state(current, command_type, value) if current is not None else None
+        recent.until = time.monotonic() + self.window
+        try:
+            await self.send(uid, command_type, value, current)
+        except Exception:
+            recent.sent = recent.state = None  # don't dedup against a state the unit never reached
+            raise
+        return True
+
+    @staticmethod
+    def _skip(reason):
+        metrics.COMMANDS_SKIPPED.inc(reason=reason)
+        return False
+
+    @staticmethod
+    def _same(command_type, value, sent):
+        if sent is None:
+            return False
+        if command_type == "temperature":
+            try:
+                return float(value) == float(sent)
+            except ValueError:
+                return False
+        return value.strip().lower() == sent.strip().lower()
+
+    @staticmethod
+    def _is_noop(uid, command_type, value, current):
+        if current is None:
+            return False
+        try:
+            return not unit_commands(uid, command_type, value, current)
+        except ValueError:
+            return False  # let the client reject and log it as before
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from fnmatch import fnmatchcase
+
+from coolmaster.capabilities import DEFAULT, CapabilityCache, UnitCapabilities, parse_props
+from coolmaster.client import CoolMasterClient, PRIORITY_POLL, unit_commands
+from coolmaster.poll_scheduler import PollScheduler
+
+
+class Controller:
+    """
+    One CoolMasterNet device: its own connection, poll scheduler and unit namespace.
+
+    Unit IDs are only unique per device (every controller has an `L1.001`), so a
+    named controller exposes them to the rest of the bridge as `<name>.L1.001`.
+    An unnamed controller keeps the bare IDs, which is what single-device setups
+    have always published.
+    """
+
+    def __init__(self, name, host, port=10102, scheduler_args=(), client_args=None, capability_ttl=86400.0):
+        self.name = name
+        self.client = CoolMasterClient(host, port, name=name, **(client_args or {}))
+        self.scheduler = PollScheduler(*scheduler_args)
+        self.capabilities = CapabilityCache(capability_ttl)  # keyed by namespaced UID
+        self.shards = []  # PollShards when polling is sharded, see poll_shards.build_shards
+        self.unit_ids = []
+
+    def __repr__(self):
+        return f"Controller({self.name or 'default'} @ {self.client.host}:{self.client.port})"
+
+    def qualify(self, uid):
+        return f"{self.name}.{uid}" if self.name else uid
+
+    def local(self, uid):
+        return uid[len(self.name) + 1:] if self.name else uid
+
+    async def get_units(self):
+        self.unit_ids = [self.qualify(uid) for uid in await self.client.get_units()]
+        return self.unit_ids
+
+    async def refresh_capabilities(self, uids):
+        """
+        Ask the controller what `uids` support and cache it; returns the units whose
+        capabilities changed. A unit that doesn't answer `props` is cached with the defaults.
+        """
+        responses = await self.client.get_properties([self.local(uid) for uid in uids])
+        now = time.time()
+        changed = []
+        for uid in uids:
+            caps = parse_props(responses[self.local(uid)], now) or UnitCapabilities(*DEFAULT.values(), now)
+            if self.capabilities.store(uid, caps):
+                changed.append(uid)
+        return changed
+
+    async def get_status(self, uid: str = None, priority=PRIORITY_POLL):
+        """Same contract as CoolMasterClient.get_status, with namespaced UIDs in and out."""
+        if uid:
+            return (await self.client.get_status(self.local(uid), priority)).copy(uid)
+        return self._qualify_all(await self.client.get_status(priority=priority))
+
+    async def get_changed_status(self, priority=PRIORITY_POLL, selectors=None):
+        return self._qualify_all(await self.client.get_changed_status(priority, selectors))
+
+    def schedulers(self):
+        """{shard name: PollScheduler}; the controller's own scheduler under "" when polling isn't sharded."""
+        return {shard.name: shard.scheduler for shard in self.shards} or {"": self.scheduler}
+
+    def notify_activity(self, uid):
+        """Speed up polling of whichever shard holds `uid`."""
+        for shard in self.shards:
+            if uid in shard.unit_ids:
+                shard.scheduler.notify_activity()
+                return
+        self.scheduler.notify_activity()
+
+    def reread(self, uids):
+        self.client.reread([self.local(uid) for uid in uids])
+
+    def _qualify_all(self, statuses):
+        # The client's status dicts are cached between polls, so rename copies rather than the originals
+        if not self.name:
+            return statuses
+        return {self.qualify(uid): status.copy(self.qualify(uid)) for uid, status in statuses.items()}
+
+    async def send_command(self, uid, command_type, value, current=None):
+        await self.client.send_command(self.local(uid), command_type, value, current)
+
+    async def close(self):
+        await self.client.close()
+
+
+class ControllerRouter:
+    """
+    Presents several controllers to MQTTPublisher as if they were one CoolMasterClient,
+    dispatching each call to the controller that owns the (namespaced) UID.
+    """
+
+    def __init__(self, controllers, groups=None):
+        self.controllers = list(controllers)
+        self._by_name = {c.name: c for c in self.controllers}
+        self.groups = dict(groups or {})  # group name -> unit ID patterns
+
+    def controller_for(self, uid):
+        if len(self.controllers) == 1:
+            return self.controllers[0]
+        name = uid.split(".", 1)[0]
+        if name not in self._by_name:
+            raise ValueError(f"no controller named '{name}' for unit {uid}")
+        return self._by_name[name]
+
+    def notify_activity(self, uid):
+        """Command listener: speed up polling on the controller that just received a command."""
+        try:
+            self.controller_for(uid).notify_activity(uid)
+        except ValueError:
+            pass
+
+    def capabilities_for(self, uid):
+        return self.controller_for(uid).capabilities.get(uid)
+
+    def invalidate_capabilities(self, uids):
+        """Have each poll loop re-read these units' capabilities."""
+        for uid in uids:
+            self.controller_for(uid).capabilities.invalidate((uid,))
+
+    def reread(self, uids):
+        """Have each poll loop publish these units on its next poll, changed or not."""
+        for uid in uids:
+            self.controller_for(uid).reread((uid,))
+
+    def group_members(self, group):
+        """Unit IDs in `group`: every unit for "all", else those matching the group's patterns."""
+        unit_ids = [uid for controller in self.controllers for uid in controller.unit_ids]
+        if group == "all":
+            return unit_ids
+        if group not in self.groups:
+            raise ValueError(f"unknown group '{group}'")
+        patterns = self.groups[group]
+        return [uid for uid in unit_ids if any(fnmatchcase(uid, p) for p in patterns)]
+
+    async def run_group(self, uids, command_type, value, last_status):
+        """
+        Apply one command to many units with as few round-trips as possible: commands a unit
+        doesn't support fail locally, those already satisfied by the unit's last known state
+        are dropped, and the rest go out as a single burst per controller, and controllers
+        are driven concurrently.
+        Returns {uid: "ok" | "unchanged" | error message}.
+        """
+        results, batches = {}, {}
+        for uid in uids:
+            controller = self.controller_for(uid)
+            try:
+                commands = unit_commands(controller.local(uid), command_type, value, last_status.get(uid),
+                                         controller.capabilities.get(uid))
+            except ValueError as e:
+                results[uid] = str(e)
+                continue
+            if commands:
+                batches.setdefault(controller, []).append((controller.local(uid), commands))
+            else:
+                results[uid] = "unchanged"
+
+        outcomes = await asyncio.gather(*(c.client.send_batch(batch) for c, batch in batches.items()))
+        for controller, outcome in zip(batches, outcomes):
+            for uid, error in outcome.items():
+                results[controller.qualify(uid)] = error or "ok"
+        return results
+
+    async def get_status(self, uid: str, priority=PRIORITY_POLL):
+        return await self.controller_for(uid).get_status(uid, priority)
+
+    async def send_command(self, uid, command_type, value, current=None):
+        await self.controller_for(uid).send_command(uid, command_type, value, current)
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import deque
+
+
+class PollScheduler:
+    """
+    Fixed-cadence, activity-aware poll timer.
+
+    Cycles are timed start-to-start, so the time `ls2` takes is absorbed into the
+    interval instead of being added to it. Any change or command snaps the interval
+    down to `min_interval` for `active_hold` seconds; after that each quiet cycle
+    stretches it by `backoff` until `max_interval` is reached. With `follow_changes` off,
+    only commands snap it down; changed data keeps the current cadence.
+    """
+
+    def __init__(self, interval=2.0, min_interval=0.5, max_interval=10.0, backoff=1.5, active_hold=10.0,
+                 follow_changes=True):
+        self.base_interval = interval
+        self.min_interval = min(min_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.backoff = backoff
+        self.active_hold = active_hold
+        self.follow_changes = follow_changes
+
+        self.interval = interval
+        self._active_until = 0.0
+        self._cycle_started = None
+        self._activity = asyncio.Event()
+        self._starts = deque(maxlen=50)  # recent cycle start times, for the achieved rate
+
+        self.cycles = 0
+        self.overruns = 0
+        self.cycle_time_total = 0.0
+        self.cycle_time_max = 0.0
+        self.last_cycle_time = 0.0
+        self.overran = False  # whether the last cycle took longer than its interval
+
+    def start_cycle(self):
+        self._cycle_started = time.monotonic()
+        self._starts.append(self._cycle_started)
+
+    def end_cycle(self, changed=False):
+        """Record how long the cycle took and pick the interval for the next one."""
+        now = time.monotonic()
+        elapsed = now - self._cycle_started
+        self.cycles += 1
+        self.last_cycle_time = elapsed
+        self.cycle_time_total += elapsed
+        self.cycle_time_max = max(self.cycle_time_max, elapsed)
+        self.overran = elapsed > self.interval
+        if self.overran:
+            self.overruns += 1
+
+        if changed and self.follow_changes:
+            self._go_active(now)
+        elif now >= self._active_until:
+            self.interval = min(self.max_interval, max(self.interval * self.backoff, self.min_interval))
+
+    def notify_activity(self, *args):
+        """A command was sent: poll quickly again, cutting any long quiet sleep short."""
+        self._go_active(time.monotonic())
+        self._activity.set()
+
+    async def wait(self):
+        """Sleep until the next cycle is due, measured from the start of the previous one."""
+        while True:
+            delay = self._cycle_started + self.interval - time.monotonic()
+            if delay <= 0:
+                self._activity.clear()  # overran or interval shrank: go now, don't try to catch up
+                return
+            try:
+                await asyncio.wait_for(self._activity.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                self._activity.clear()
+                return
+            self._activity.clear()  # interval shrank, recompute the deadline
+
+    def _go_active(self, now):
+        self.interval = self.min_interval
+        self._active_until = now + self.active_hold
+
+    def achieved_rate(self):
+        if len(self._starts) < 2:
+            return 0.0
+        span = self._starts[-1] - self._starts[0]
+        return (len(self._starts) - 1) / span if span > 0 else 0.0
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "target_rate": 1 / self.interval,
+            "achieved_rate": self.achieved_rate(),
+            "cycles": self.cycles,
+            "overruns": self.overruns,
+            "cycle_time_avg": self.cycle_time_total / self.cycles if self.cycles else 0.0,
+            "cycle_time_max": self.cycle_time_max,
+            "last_cycle_time": self.last_cycle_time,
+        }
+
+    def report(self):
+        s = self.stats()
+        return (
+            f"poll {s['achieved_rate']:.2f}/s (target {s['target_rate']:.2f}/s, interval {s['interval']:.2f}s), "
+            f"cycle avg {s['cycle_time_avg'] * 1000:.0f}ms max {s['cycle_time_max'] * 1000:.0f}ms, "
+            f"{s['overruns']} overruns in {s['cycles']} cycles"
+        )
@@ -0,0 +1,84 @@
+from collections import Counter
+from fnmatch import fnmatchcase
+
+from coolmaster.poll_scheduler import PollScheduler
+
+# A shard holding at least this share of a line reads the whole line: one round-trip instead of one per unit
+LINE_SHARE = 0.25
+
+
+class PollShard:
+    """
+    Some of one controller's units, polled on their own schedule.
+
+    `selectors` are what follows `ls2` (a whole line like `L1`, or single unit IDs),
+    all sent as one burst per cycle; None polls every unit with a bare `ls2`. A line
+    can bring in units of other shards too; they are published like the shard's own.
+    `offset` delays the first cycle so shards don't all hit the controller at once.
+    """
+
+    def __init__(self, name, unit_ids, selectors, scheduler, offset=0.0):
+        self.name = name
+        self.unit_ids = set(unit_ids)
+        self.selectors = selectors
+        self.scheduler = scheduler
+        self.offset = offset
+
+    def __repr__(self):
+        polled = "all" if self.selectors is None else ",".join(self.selectors)
+        return f"{self.name or 'all'}({len(self.unit_ids)} units, ls2 {polled}, every {self.scheduler.base_interval:g}s)"
+
+
+def _line(uid):
+    return uid.split(".", 1)[0]
+
+
+def _selectors(local_ids, line_sizes):
+    """`ls2` arguments covering `local_ids`: a line when the shard holds a good share of it, else each unit."""
+    in_shard = Counter(_line(uid) for uid in local_ids)
+    selectors = []
+    for uid in local_ids:
+        line = _line(uid)
+        if in_shard[line] < LINE_SHARE * line_sizes[line]:
+            selectors.append(uid)
+        elif line not in selectors:
+            selectors.append(line)
+    return selectors
+
+
+def build_shards(controller, spec):
+    """
+    Split `controller`'s units into shards per POLL_SHARD_SPEC: "line", or
+    [(name, interval or None, patterns)] where units matching no shard go to "rest".
+    Shards without an interval inherit the controller's adaptive schedule; a fixed
+    interval is never stretched when quiet, and only shortened by commands, not by changed data.
+    """
+    local = controller.local
+    if spec == "line":
+        lines = {}
+        for uid in controller.unit_ids:
+            lines.setdefault(_line(local(uid)), []).append(uid)
+        plan = [(line, None, members) for line, members in lines.items()]
+    else:
+        plan, remaining = [], list(controller.unit_ids)
+        for name, interval, patterns in spec:
+            members = [uid for uid in remaining if any(fnmatchcase(uid, p) for p in patterns)]
+            if members:
+                plan.append((name, interval, members))
+                taken = set(members)
+                remaining = [uid for uid in remaining if uid not in taken]
+        if remaining:
+            plan.append(("rest", None, remaining))
+
+    base = controller.scheduler
+    line_sizes = Counter(_line(local(uid)) for uid in controller.unit_ids)
+    shards = []
+    for index, (name, interval, members) in enumerate(plan):
+        if interval:
+            scheduler = PollScheduler(interval, base.min_interval, interval, base.backoff, base.active_hold,
+                                      follow_changes=False)
+        else:
+            scheduler = PollScheduler(base.base_interval, base.min_interval, base.max_interval, base.backoff, base.active_hold)
+        selectors = _selectors([local(uid) for uid in members], line_sizes)
+        shards.append(PollShard(name, members, selectors, scheduler, index * base.base_interval / len(plan)))
+    return shards
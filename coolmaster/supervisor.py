@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import random
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Backoff:
+    """Exponential reconnect delay with jitter: `initial` doubling up to `maximum`, each scaled by 1-`jitter`..1."""
+
+    def __init__(self, initial=1.0, maximum=30.0, factor=2.0, jitter=0.5):
+        self.initial = initial
+        self.maximum = max(maximum, initial)
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next(self):
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
+
+
+class ConnectionSupervisor:
+    """
+    Health of one controller connection.
+
+    The client reports every reply (`succeeded`) and every failure (`failed`);
+    the supervisor paces reconnects with jittered exponential backoff, tells
+    listeners when the controller becomes available or unavailable, and records
+    how long each outage lasted. Its task probes an idle connection every
+    `keepalive` seconds so a half-open socket is found before a command needs it.
+    """
+
+    def __init__(self, client, keepalive=30.0, backoff=None):
+        self.client = client
+        self.keepalive = keepalive
+        self.backoff = backoff or Backoff()
+        self.available = None      # unknown until the first exchange
+        self.down_since = None
+        self.last_reply = time.monotonic()
+        self.listeners = []        # callable(available: bool)
+        self._task = None
+
+    def start(self):
+        if self.keepalive and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._keepalive())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def succeeded(self):
+        self.last_reply = time.monotonic()
+        if self.available:
+            return
+        if self.down_since is not None:
+            outage = self.last_reply - self.down_since
+            metrics.RECOVERY_SECONDS.observe(outage, controller=self.client.name)
+            logger.info("✅ %s reachable again after %.1fs", self.client.name, outage)
+        self.down_since = None
+        self.backoff.reset()
+        self._set_available(True)
+
+    async def failed(self, error, retry=True):
+        """Drop the connection; with `retry`, wait out the next backoff delay before the caller reconnects."""
+        if self.down_since is None:
+            self.down_since = time.monotonic()
+            logger.warning("⚠️ %s connection lost: %s", self.client.name, error)
+        if self.available is not False:
+            self._set_available(False)
+        await self.client._reset_connection()
+        if retry:
+            delay = self.backoff.next()
+            logger.info("⏳ Reconnecting to %s in %.1fs", self.client.name, delay,
+                        extra={"rate_key": f"{self.client.name} reconnect attempts"})
+            await asyncio.sleep(delay)
+
+    def _set_available(self, available):
+        self.available = available
+        metrics.CONTROLLER_UP.set(int(available), controller=self.client.name)
+        for listener in self.listeners:
+            try:
+                listener(available)
+            except Exception as e:
+                logger.error("❌ Availability listener failed: %s", e)
+
+    async def _keepalive(self):
+        """Probe the controller whenever it has been quiet for `keepalive` seconds."""
+        while True:
+            idle = time.monotonic() - self.last_reply
+            if idle < self.keepalive:
+                await asyncio.sleep(self.keepalive - idle)
+                continue
+            try:
+                await self.client.ping()
+            except Exception as e:
+                logger.debug("💓 Keepalive to %s failed: %s", self.client.name, e)
+                await asyncio.sleep(self.keepalive / 2)
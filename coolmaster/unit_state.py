@@ -0,0 +1,109 @@
+FIELDS = ("uid", "is_on", "thermostat", "temperature", "fan_mode", "hvac_mode", "status", "has_error", "state")
+
+# One bit per field, in FIELDS order, for change masks
+UID, IS_ON, THERMOSTAT, TEMPERATURE, FAN_MODE, HVAC_MODE, STATUS, HAS_ERROR, STATE = (1 << i for i in range(len(FIELDS)))
+ALL_FIELDS = (1 << len(FIELDS)) - 1
+_FIELD_BITS = tuple((name, 1 << i) for i, name in enumerate(FIELDS))
+
+
+class UnitState:
+    """
+    One unit's status as parsed from an ls2 line, with a fixed field order.
+
+    Floats are rounded once at construction, so records compare directly and
+    change detection needs no per-field sanitising.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, uid, is_on, thermostat, temperature, fan_mode, hvac_mode, status, has_error, state):
+        self.uid = uid
+        self.is_on = is_on
+        self.thermostat = thermostat
+        self.temperature = temperature
+        self.fan_mode = fan_mode
+        self.hvac_mode = hvac_mode
+        self.status = status
+        self.has_error = has_error
+        self.state = state
+
+    def __repr__(self):
+        return "UnitState(" + ", ".join(f"{name}={getattr(self, name)!r}" for name in FIELDS) + ")"
+
+    def copy(self, uid=None):
+        state = UnitState(*(getattr(self, name) for name in FIELDS))
+        if uid is not None:
+            state.uid = uid
+        return state
+
+    def diff(self, other):
+        """Bitmask of the fields where `other` differs from this record."""
+        mask = 0
+        for name, bit in _FIELD_BITS:
+            if getattr(self, name) != getattr(other, name):
+                mask |= bit
+        return mask
+
+    def assign(self, other, mask):
+        """Copy the fields selected by `mask` from `other` into this record, in place."""
+        for name, bit in _FIELD_BITS:
+            if mask & bit:
+                setattr(self, name, getattr(other, name))
+
+    def describe(self, other, mask):
+        """'field old→new, ...' for the masked fields, for logging."""
+        return ", ".join(f"{name} {getattr(self, name)}→{getattr(other, name)}" for name, bit in _FIELD_BITS if mask & bit)
+
+
+def round_temperature(value):
+    return None if value != value else round(value, 2)  # NaN → None
+
+
+class StatusTable:
+    """
+    Last published state per unit, in a table preallocated from the discovered unit list.
+
+    Rows are owned copies that are updated in place, so the poll loop allocates
+    nothing for units that did not change.
+    """
+
+    __slots__ = ("_index", "_rows")
+
+    def __init__(self, unit_ids=()):
+        self._index = {}
+        self._rows = []
+        self.reserve(unit_ids)
+
+    def reserve(self, unit_ids):
+        for uid in unit_ids:
+            if uid not in self._index:
+                self._index[uid] = len(self._rows)
+                self._rows.append(None)
+
+    def get(self, uid, default=None):
+        i = self._index.get(uid)
+        row = self._rows[i] if i is not None else None
+        return default if row is None else row
+
+    def store(self, state):
+        """Take a private copy of `state` as the unit's row and return it."""
+        if state.uid not in self._index:
+            self.reserve((state.uid,))
+        row = self._rows[self._index[state.uid]] = state.copy()
+        return row
+
+    def discard(self, uid):
+        """Forget the unit's row, keeping its slot."""
+        i = self._index.get(uid)
+        if i is not None:
+            self._rows[i] = None
+
+    def rows(self):
+        """The stored rows, in reservation order."""
+        return [row for row in self._rows if row is not None]
+
+    def __contains__(self, uid):
+        return self.get(uid) is not None
+
+    def __len__(self):
+        return sum(row is not None for row in self._rows)
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import signal
+import sys
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger("bridge")
+
+# Messages logged with extra={"rate_key": ...} share a budget per key and window; the rest are counted
+RATE_LIMITER = None
+# Recent records, kept unformatted until someone asks for them
+BUFFER = None
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(message)s", datefmt="%H:%M:%S")
+
+
+class JsonFormatter(logging.Formatter):
+    _STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "rate_key"}
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in self._STANDARD})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through `limit` records per rate_key per window; count the rest for summarize()."""
+
+    def __init__(self, limit=5, window=60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._counts = {}  # rate_key -> [shown, suppressed]
+
+    def filter(self, record):
+        key = getattr(record, "rate_key", None)
+        if key is None or not self.limit:
+            return True
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0, 0]
+        if counts[0] < self.limit:
+            counts[0] += 1
+            return True
+        counts[1] += 1
+        return False
+
+    def take_summary(self):
+        """Return {rate_key: suppressed count} for the window that just ended and start a new one."""
+        summary = {key: suppressed for key, (_, suppressed) in self._counts.items() if suppressed}
+        self._counts.clear()
+        return summary
+
+
+class RingBufferHandler(logging.Handler):
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def dump(self, stream=None, formatter=None):
+        stream = stream or sys.stdout
+        formatter = formatter or TextFormatter()
+        stream.write(f"---- last {len(self.records)} log events ----\n")
+        for record in list(self.records):
+            stream.write(formatter.format(record) + "\n")
+        stream.write("---- end of log events ----\n")
+        stream.flush()
+
+
+def _level(value, setting, problems):
+    """A logging level from a name like "DEBUG" or a number; unknown names fall back to INFO."""
+    if isinstance(value, int):
+        return value
+    level = logging.getLevelName(value.strip().upper())
+    if isinstance(level, int):
+        return level
+    problems.append(f"⚠️ Unknown {setting} '{value}', using INFO")
+    return logging.INFO
+
+
+def setup(level="INFO", fmt="text", rate_limit=5, rate_window=60.0, buffer_size=1000, buffer_level="INFO"):
+    """Route all bridge logging to stdout (text or JSON) with rate limiting, plus an in-memory ring buffer."""
+    global RATE_LIMITER, BUFFER
+    problems = []
+    level = _level(level, "LOG_LEVEL", problems)
+    buffer_level = _level(buffer_level, "LOG_BUFFER_LEVEL", problems)
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+
+    RATE_LIMITER = RateLimitFilter(rate_limit, rate_window)
+    output = logging.StreamHandler(sys.stdout)
+    output.setLevel(level)
+    output.setFormatter(formatter)
+    output.addFilter(RATE_LIMITER)
+
+    BUFFER = RingBufferHandler(buffer_size)
+    BUFFER.setLevel(buffer_level)
+    BUFFER.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.handlers = [output, BUFFER] if buffer_size else [output]
+    root.setLevel(min(level, buffer_level) if buffer_size else level)
+    for problem in problems:
+        logger.warning(problem)
+
+
+def dump():
+    """Write the buffered recent events to stdout."""
+    if BUFFER is not None:
+        BUFFER.dump(formatter=BUFFER.formatter)
+
+
+def install_dump_signal(loop):
+    """`kill -USR1 <pid>` (or `docker kill -s USR1`) dumps the ring buffer."""
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, dump)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        pass  # no SIGUSR1 / signal handlers on this platform
+
+
+async def summarize_forever():
+    """Every rate window, report how many rate-limited messages were held back, per key."""
+    while RATE_LIMITER is not None and RATE_LIMITER.limit:
+        await asyncio.sleep(RATE_LIMITER.window)
+        for key, suppressed in RATE_LIMITER.take_summary().items():
+            logger.info("🧮 %d more %s in last %.0fs (not shown)", suppressed, key, RATE_LIMITER.window)
@@ -1,78 +1,226 @@
 import asyncio
-from datetime import datetime
-from math import isnan
-
-from config import COOLMASTER_HOST, COOLMASTER_PORT, POLL_INTERVAL, USE_BATCH_POLLING
-from coolmaster.client import CoolMasterClient
+import logging
+import signal
+import time
+
+import logs
+import metrics
+import snapshot
+from config import (
+    COOLMASTER_CONTROLLERS, COOLMASTER_GROUP_MEMBERS, COOLMASTER_PIPELINE_DEPTH,
+    COOLMASTER_BACKOFF_INITIAL, COOLMASTER_BACKOFF_MAX, COOLMASTER_KEEPALIVE, SNAPSHOT_PATH, SNAPSHOT_INTERVAL, USE_BATCH_POLLING, TEMPERATURE_DEADBAND, METRICS_HOST, METRICS_PORT,
+    CAPABILITY_TTL, CAPABILITY_REFRESH_BATCH,
+    LOG_LEVEL, LOG_FORMAT, LOG_RATE_LIMIT, LOG_RATE_WINDOW, LOG_BUFFER_SIZE, LOG_BUFFER_LEVEL,
+    POLL_INTERVAL, POLL_INTERVAL_MIN, POLL_INTERVAL_MAX, POLL_BACKOFF, POLL_ACTIVE_HOLD, POLL_REPORT_INTERVAL,
+    POLL_SHARD_SPEC,
+)
+from coolmaster.controller import Controller, ControllerRouter
+from coolmaster.poll_shards import PollShard, build_shards
+from coolmaster.supervisor import Backoff
+from coolmaster.unit_state import ALL_FIELDS, TEMPERATURE, StatusTable
 from mqtt.publisher import MQTTPublisher
 
-def log(msg):
-    print(f"{datetime.now().strftime('%H:%M:%S')} 🧠 {msg}")
+logger = logging.getLogger("bridge")
 
-def clean(value):
-    """Sanitize value for safe comparison and caching."""
-    try:
-        if value is None:
-            return None
-        if isinstance(value, float):
-            if isnan(value):
-                return None
-            return round(value, 2)
-        return value
-    except Exception:
-        return None
+def apply_status(mqtt, last_status, status):
+    """Diff a unit's status against its cached row; publish and update the row in place if anything changed."""
+    uid = status.uid
+    last = last_status.get(uid)
 
-async def main():
-    log("CoolMaster → MQTT bridge starting...")
+    if last is None:
+        changed = ALL_FIELDS
+        logger.debug("🔄 %s → new: %s", uid, status)
+        last = last_status.store(status)
+    else:
+        changed = last.diff(status)
 
-    client = CoolMasterClient(COOLMASTER_HOST, COOLMASTER_PORT)
-    loop = asyncio.get_running_loop()
-    mqtt = MQTTPublisher(client, loop)
-    last_status = {}
-    unit_ids = await client.get_units()
-    log(f"📡 Discovered CoolMasterNet units: {unit_ids}")
+        # Hysteresis on room temperature: sensor jitter below the deadband is not a change
+        if TEMPERATURE_DEADBAND and changed & TEMPERATURE and last.temperature is not None \
+                and status.temperature is not None and abs(status.temperature - last.temperature) < TEMPERATURE_DEADBAND:
+            changed &= ~TEMPERATURE
 
-    if USE_BATCH_POLLING:
-        log("📥 Using batch polling for all units")
+        if not changed:
+            return 0
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("🔄 %s → %s", uid, last.describe(status, changed), extra={"rate_key": f"changes to {uid}"})
+        last.assign(status, changed)
 
-    for uid in unit_ids:
-        mqtt.publish_climate_config(uid)
+    # MQTT
+    try:
+        mqtt.publish_climate_state(last, changed)
+    except Exception as e:
+        logger.error("❌ MQTT publish error for %s: %s", uid, e)
+
+    return changed
 
+async def refresh_capabilities(controller, mqtt, uids, tag="", limit=None):
+    """Re-read the capabilities of those `uids` that are due (at most `limit`) and rebuild their discovery if they changed."""
+    stale = controller.capabilities.stale(uids)[:limit]
+    if not stale:
+        return
+    try:
+        changed = await controller.refresh_capabilities(stale)
+    except Exception as e:
+        logger.warning("⚠️ %sCapability query failed, will retry: %s", tag, e, extra={"rate_key": f"{tag}capability queries"})
+        return
+    for uid in changed:
+        mqtt.publish_climate_config(uid, rebuild=True)
+    if changed:
+        logger.info("🔍 %sCapabilities changed for %s", tag, ", ".join(changed))
+
+async def poll_controller(controller, mqtt, last_status):
+    """Discover and poll one CoolMasterNet device for as long as the bridge runs."""
+    tag = f"[{controller.name}] " if controller.name else ""
+
+    if controller.unit_ids:
+        # Restored from the snapshot; the first poll reports every unit anyway, so no `ls` is needed
+        logger.info("📡 %sUsing %d units from the snapshot", tag, len(controller.unit_ids))
+    else:
+        backoff = Backoff(COOLMASTER_BACKOFF_INITIAL, COOLMASTER_BACKOFF_MAX)
+        while True:
+            try:
+                await controller.get_units()
+                break
+            except Exception as e:
+                delay = backoff.next()
+                logger.error("❌ %sUnit discovery failed: %s — will retry after %.0fs", tag, e, delay)
+                await asyncio.sleep(delay)
+        logger.info("📡 %sDiscovered CoolMasterNet units: %s", tag, controller.unit_ids)
+    last_status.reserve(controller.unit_ids)
+    # Discovery is built from the capabilities, so read them first (the snapshot's are kept until they expire)
+    await refresh_capabilities(controller, mqtt, controller.unit_ids, tag)
+
+    # Hash-gated: after a warm start nothing is sent unless a payload changed
+    for uid in controller.unit_ids:
+        mqtt.publish_climate_config(uid)
+    known = set(controller.unit_ids)
+
+    if POLL_SHARD_SPEC:
+        controller.shards = build_shards(controller, POLL_SHARD_SPEC)
+        logger.info("🧩 %sPolling in %d shards: %s", tag, len(controller.shards), controller.shards)
+        await asyncio.gather(*(poll_shard(controller, shard, mqtt, last_status, known) for shard in controller.shards))
+    else:
+        await poll_shard(controller, PollShard("", controller.unit_ids, None, controller.scheduler), mqtt, last_status, known)
+
+async def poll_shard(controller, shard, mqtt, last_status, known):
+    """Poll one shard of a controller's units on the shard's own schedule, publishing as soon as its cycle is read."""
+    scheduler = shard.scheduler
+    tag = "".join(f"[{part}] " for part in (controller.name, shard.name) if part)
+    label = controller.client.name
+
+    await asyncio.sleep(shard.offset)
+    next_report = time.monotonic() + POLL_REPORT_INTERVAL
     while True:
+        scheduler.start_cycle()
+        changed_units = 0
+
         if USE_BATCH_POLLING:
             try:
-                current_statuses = await client.get_status()
+                # Only units whose ls2 line differs from the previous cycle come back
+                current_statuses = await controller.get_changed_status(selectors=shard.selectors)
+
+                for uid in current_statuses.keys() - known:
+                    logger.info("📡 %sNew unit %s", tag, uid)
+                    known.add(uid)
+                    shard.unit_ids.add(uid)
+                    controller.unit_ids.append(uid)
+                    last_status.reserve((uid,))
+                    await refresh_capabilities(controller, mqtt, (uid,), tag)
+                    mqtt.publish_climate_config(uid)
 
                 for uid, status in current_statuses.items():
-                    current = {k: clean(v) for k, v in status.items()}
-                    last = last_status.get(uid, {})
-                    changed = {}
+                    if apply_status(mqtt, last_status, status):
+                        changed_units += 1
 
-                    for key, value in current.items():
-                        if last.get(key) != value:
-                            changed[key] = {"from": last.get(key), "to": value}
+            except Exception as e:
+                logger.error("❌ %sPolling error: %s — will retry after %.1fs", tag, e, scheduler.interval,
+                             extra={"rate_key": f"{tag}polling errors"})
+        else:
+            logger.warning("⚠️ Use BATCH POLLING, Single unit polling not supported", extra={"rate_key": "polling mode warnings"})
+
+        scheduler.end_cycle(changed_units > 0)
+        metrics.POLL_CYCLE_SECONDS.observe(scheduler.last_cycle_time, controller=label, shard=shard.name)
+        metrics.CHANGED_UNITS.observe(changed_units, controller=label, shard=shard.name)
+        metrics.POLL_INTERVAL_SECONDS.set(scheduler.interval, controller=label, shard=shard.name)
+        if scheduler.overran:
+            metrics.POLL_OVERRUNS.inc(controller=label, shard=shard.name)
+
+        if POLL_REPORT_INTERVAL and time.monotonic() >= next_report:
+            logger.info("⏱️ %s%s", tag, scheduler.report())
+            next_report = time.monotonic() + POLL_REPORT_INTERVAL
+
+        # Expired or invalidated capabilities, a few units per cycle so polling keeps its pace
+        await refresh_capabilities(controller, mqtt, shard.unit_ids, tag, CAPABILITY_REFRESH_BATCH)
+
+        await scheduler.wait()
+
+def build_bridge(loop):
+    """Wire up the controllers, the shared MQTT publisher and the status cache."""
+    scheduler_args = (POLL_INTERVAL, POLL_INTERVAL_MIN, POLL_INTERVAL_MAX, POLL_BACKOFF, POLL_ACTIVE_HOLD)
+    client_args = {
+        "pipeline_depth": COOLMASTER_PIPELINE_DEPTH,
+        "keepalive": COOLMASTER_KEEPALIVE,
+        "backoff": (COOLMASTER_BACKOFF_INITIAL, COOLMASTER_BACKOFF_MAX),
+    }
+    controllers = [Controller(name, host, port, scheduler_args, client_args, CAPABILITY_TTL)
+                   for name, host, port in COOLMASTER_CONTROLLERS]
+    router = ControllerRouter(controllers, COOLMASTER_GROUP_MEMBERS)
+    logger.info("🏢 Managing %d CoolMasterNet controller(s): %s", len(controllers), controllers)
+
+    # One MQTT session and publish queue shared by every controller
+    mqtt = MQTTPublisher(router, loop)
+    last_status = StatusTable()
+    # Commands publish optimistic/refreshed state through the same cache as the poll loop
+    mqtt.last_status = last_status
+    mqtt.status_handler = lambda status: apply_status(mqtt, last_status, status)
+    mqtt.command_listener = router.notify_activity
+    for controller in controllers:
+        controller.client.supervisor.listeners.append(
+            lambda available, name=controller.name: mqtt.publish_controller_availability(name, available)
+        )
+    return controllers, mqtt, last_status
 
-                    if changed:
-                        log(f"🔄 {uid} → " + ', '.join(f"{k} {v['from']}→{v['to']}" for k, v in changed.items()))
+async def main():
+    logs.setup(LOG_LEVEL, LOG_FORMAT, LOG_RATE_LIMIT, LOG_RATE_WINDOW, LOG_BUFFER_SIZE, LOG_BUFFER_LEVEL)
+    logs.install_dump_signal(asyncio.get_running_loop())
+    asyncio.create_task(logs.summarize_forever())
+    logger.info("CoolMaster → MQTT bridge starting...")
+    if METRICS_PORT:
+        await metrics.start_server(METRICS_HOST, METRICS_PORT)
+    loop = asyncio.get_running_loop()
+    controllers, mqtt, last_status = build_bridge(loop)
 
-                        # MQTT
-                        try:
-                            mqtt.publish_climate_state(status)
-                        except Exception as e:
-                            log(f"❌ MQTT publish error for {uid}: {e}")
+    if USE_BATCH_POLLING:
+        logger.info("📥 Using batch polling for all units")
 
-                        # Cache updated state
-                        last_status[uid] = current
+    state = snapshot.load(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+    if state:
+        for controller in snapshot.restore(state, controllers, mqtt, last_status):
+            # Known units are usable straight away; the supervisor corrects this if the controller is down
+            mqtt.publish_controller_availability(controller.name, True)
 
-            except Exception as e:
-                log(f"❌ Polling error: {e} — will retry after {POLL_INTERVAL}s")
-        else:
-            log("⚠️ Use BATCH POLLING, Single unit polling not supported")
+    tasks = [asyncio.create_task(poll_controller(c, mqtt, last_status)) for c in controllers]
+    if SNAPSHOT_PATH:
+        capture = lambda: snapshot.capture(controllers, mqtt, last_status)
+        tasks.append(asyncio.create_task(snapshot.save_forever(SNAPSHOT_PATH, SNAPSHOT_INTERVAL, capture)))
 
-        await asyncio.sleep(POLL_INTERVAL)
+    # `docker stop` sends SIGTERM: shut down through the same path as Ctrl+C so the snapshot is written
+    try:
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except (NotImplementedError, RuntimeError):
+        pass
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for controller in controllers:
+            await controller.close()
+        if SNAPSHOT_PATH:
+            snapshot.save(SNAPSHOT_PATH, snapshot.capture(controllers, mqtt, last_status))
+            logger.info("💾 Saved snapshot to %s", SNAPSHOT_PATH)
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
-    except KeyboardInterrupt:
-        log("🛑 Stopped by user.")
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info("🛑 Stopped.")
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Recording is a no-op until the endpoint is started, so a bridge without METRICS_PORT pays nothing
+ENABLED = False
+_REGISTRY = []
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._function = None
+        _REGISTRY.append(self)
+
+    def set_function(self, function):
+        """Compute the value at scrape time instead: `function()` returns a number (no labels)."""
+        self._function = function
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def _samples(self):
+        if self._function is not None:
+            return [("", (), self._function())]
+        return [("", key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if ENABLED:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if ENABLED:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# CoolMaster socket
+REQUEST_SECONDS = Histogram("coolmaster_request_seconds", "Wire time of a CoolMaster command, send to prompt", ("controller", "verb"))
+QUEUE_WAIT_SECONDS = Histogram("coolmaster_queue_wait_seconds", "Time a CoolMaster command waited for the socket", ("controller", "verb"))
+RECONNECTS = Counter("coolmaster_reconnects_total", "CoolMaster connection resets", ("controller",))
+CONTROLLER_UP = Gauge("coolmaster_up", "Whether the controller answered its last exchange (1) or not (0)", ("controller",))
+RECOVERY_SECONDS = Histogram("coolmaster_recovery_seconds", "Time from losing a controller to its next reply", ("controller",),
+                             (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800))
+
+# Poll loop
+POLL_CYCLE_SECONDS = Histogram("bridge_poll_cycle_seconds", "Duration of one poll cycle", ("controller", "shard"))
+POLL_OVERRUNS = Counter("bridge_poll_overruns_total", "Poll cycles that took longer than the poll interval", ("controller", "shard"))
+POLL_INTERVAL_SECONDS = Gauge("bridge_poll_interval_seconds", "Current adaptive poll interval", ("controller", "shard"))
+CHANGED_UNITS = Histogram("bridge_changed_units", "Units with a changed state per poll cycle", ("controller", "shard"), COUNT_BUCKETS)
+
+# MQTT
+PUBLISH_QUEUE_DEPTH = Gauge("mqtt_publish_queue_depth", "Messages waiting in the outbound publish queue")
+PUBLISH_INFLIGHT = Gauge("mqtt_publish_inflight", "Publishes handed to the client and awaiting broker ack")
+PUBLISH_DROPPED = Counter("mqtt_publish_dropped_total", "Publishes dropped because the queue was full")
+PUBLISH_ACK_SECONDS = Histogram("mqtt_publish_ack_seconds", "Time from handing a publish to the client to its ack")
+COMMAND_SECONDS = Histogram("bridge_command_seconds", "MQTT command received to CoolMaster reply", ("command",))
+COMMANDS_SKIPPED = Counter("bridge_commands_skipped_total", "MQTT commands never sent: superseded within the debounce window or already in effect", ("reason",))
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass  # headers are irrelevant
+
+        path = request_line.split()[1] if len(request_line.split()) > 1 else b"/"
+        if path.split(b"?")[0] == b"/metrics":
+            body, status = render().encode(), "200 OK"
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, status, content_type = b"Not Found\n", "404 Not Found", "text/plain"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host, port):
+    """Enable recording and serve /metrics in Prometheus text format."""
+    global ENABLED
+    ENABLED = True
+    server = await asyncio.start_server(_handle, host, port)
+    logger.info("📊 Metrics on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,416 @@
+"""
+MQTT client that runs on the bridge's own event loop (MQTT_TRANSPORT=asyncio).
+
+It implements the part of paho's Client API the bridge uses, so MQTTPublisher and
+PublishQueue drive it exactly like paho, but every callback runs on the loop: no
+network thread, no cross-thread handoff for commands or publish acks. It speaks
+MQTT 3.1.1 or 5; with 5, repeated topics are sent as topic aliases, up to the
+broker's Topic Alias Maximum.
+"""
+import asyncio
+import logging
+import secrets
+import struct
+import time
+
+from coolmaster.supervisor import Backoff
+
+logger = logging.getLogger(__name__)
+
+# Same values as paho, so callers can keep using paho's constants and error_string()
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+TOPIC_ALIAS = 0x23
+TOPIC_ALIAS_MAXIMUM = 0x22
+# MQTT 5 property id -> fixed size in bytes; 0x0B is a variable byte integer, 0x26 a string pair, the rest length-prefixed
+_PROPERTY_SIZES = {
+    0x01: 1, 0x02: 4, 0x11: 4, 0x13: 2, 0x17: 1, 0x18: 4, 0x19: 1, 0x21: 2,
+    0x22: 2, 0x23: 2, 0x24: 1, 0x25: 1, 0x27: 4, 0x28: 1, 0x29: 1, 0x2A: 1,
+}
+# MQTT 5 CONNACK reason codes -> the 3.1.1 return codes MQTTPublisher._on_connect reports on
+_CONNACK_V5 = {0x84: 1, 0x85: 2, 0x88: 3, 0x86: 4, 0x87: 5}
+
+
+class MessageInfo:
+    __slots__ = ("mid", "rc")
+
+    def __init__(self, mid, rc):
+        self.mid = mid
+        self.rc = rc
+
+
+class Message:
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic, payload, qos, retain):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte, value = value % 128, value // 128
+        out.append(byte | 0x80 if value else byte)
+        if not value:
+            return bytes(out)
+
+
+def _read_varint(data, offset):
+    value, shift = 0, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def _utf8(value):
+    encoded = value.encode() if isinstance(value, str) else value
+    return struct.pack("!H", len(encoded)) + encoded
+
+
+def _string(data, offset):
+    (length,) = struct.unpack_from("!H", data, offset)
+    return data[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+def _packet(packet_type, body, flags=0):
+    return bytes([(packet_type << 4) | flags]) + _varint(len(body)) + body
+
+
+def _read_properties(data, offset):
+    """Parse an MQTT 5 property block; returns ({id: value}, offset after it). User properties are skipped."""
+    length, offset = _read_varint(data, offset)
+    end = offset + length
+    properties = {}
+    while offset < end:
+        pid = data[offset]
+        offset += 1
+        if pid in _PROPERTY_SIZES:
+            size = _PROPERTY_SIZES[pid]
+            properties[pid] = int.from_bytes(data[offset:offset + size], "big")
+            offset += size
+        elif pid == 0x0B:
+            properties[pid], offset = _read_varint(data, offset)
+        elif pid == 0x26:
+            _, offset = _string(data, offset)
+            _, offset = _string(data, offset)
+        else:
+            (size,) = struct.unpack_from("!H", data, offset)
+            properties[pid] = data[offset + 2:offset + 2 + size]
+            offset += 2 + size
+    return properties, end
+
+
+class AsyncMQTTClient:
+    """
+    paho-compatible subset: username_pw_set, will_set, max_inflight_messages_set,
+    connect, loop_start/loop_stop, disconnect, publish, subscribe, and the
+    on_connect/on_disconnect/on_message/on_publish callbacks.
+
+    The connection is kept up by a task on the loop that reconnects with backoff.
+    QoS 1 publishes made while disconnected, or left unacknowledged by a dropped
+    connection, are (re)sent after the next CONNACK, as paho does.
+    """
+
+    def __init__(self, loop, client_id=None, protocol=4, reconnect=(1.0, 30.0)):
+        self.loop = loop
+        self.client_id = client_id or f"coolmaster-bridge-{secrets.token_hex(4)}"
+        self.protocol = protocol  # 4 = MQTT 3.1.1, 5 = MQTT 5
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+
+        self._username = None
+        self._password = None
+        self._will = None
+        self._host = None
+        self._port = 1883
+        self._keepalive = 60
+        self._backoff = Backoff(*reconnect)
+
+        self._task = None
+        self._writer = None
+        self._connected = False
+        self._mid = 0
+        self._unacked = {}     # mid -> (topic, payload, qos, retain) for QoS 1 publishes awaiting PUBACK
+        self._written = []     # QoS 0 mids to report once the socket buffer has drained
+        self._flusher = None
+        self._last_sent = 0.0
+        self._last_received = 0.0
+
+        self.alias_maximum = 0  # granted by the broker in CONNACK (MQTT 5)
+        self._aliases = {}      # topic -> alias on the current connection
+
+    # -- paho-style configuration --------------------------------------------------
+
+    def username_pw_set(self, username, password=None):
+        self._username = username or None
+        self._password = password if username else None
+
+    def will_set(self, topic, payload=None, qos=0, retain=False):
+        self._will = (topic, _payload_bytes(payload), qos, retain)
+
+    def max_inflight_messages_set(self, inflight):
+        pass  # PublishQueue already bounds what is in flight
+
+    def connect(self, host, port=1883, keepalive=60):
+        """Remember where to connect; the connection is made by loop_start()'s task."""
+        self._host, self._port, self._keepalive = host, port, keepalive
+
+    connect_async = connect
+
+    def loop_start(self):
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._run())
+
+    def loop_stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def disconnect(self):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(_packet(DISCONNECT, b""))
+            self._writer.close()
+        if self._connected:
+            self._connected = False  # a clean disconnect reports rc 0, as paho does
+            self._callback(self.on_disconnect, self, None, 0)
+        self.loop_stop()
+
+    def is_connected(self):
+        return self._connected
+
+    # -- publish / subscribe ---------------------------------------------------------
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        payload = _payload_bytes(payload)
+        mid = self._next_mid()
+        if qos:
+            self._unacked[mid] = (topic, payload, qos, retain)
+        if not self._connected:
+            # QoS 1 goes out after the reconnect; QoS 0 is lost, like paho reports it
+            return MessageInfo(mid, MQTT_ERR_SUCCESS if qos else MQTT_ERR_NO_CONN)
+        self._send_publish(mid, topic, payload, qos, retain)
+        if not qos:
+            self._written.append(mid)
+            if self._flusher is None or self._flusher.done():
+                self._flusher = self.loop.create_task(self._report_written())
+        return MessageInfo(mid, MQTT_ERR_SUCCESS)
+
+    def subscribe(self, topic, qos=0):
+        mid = self._next_mid()
+        if not self._connected:
+            return MQTT_ERR_NO_CONN, mid
+        properties = b"\x00" if self.protocol == 5 else b""
+        self._write(_packet(SUBSCRIBE, struct.pack("!H", mid) + properties + _utf8(topic) + bytes([qos]), 0x02))
+        return MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic):
+        mid = self._next_mid()
+        if not self._connected:
+            return MQTT_ERR_NO_CONN, mid
+        properties = b"\x00" if self.protocol == 5 else b""
+        self._write(_packet(UNSUBSCRIBE, struct.pack("!H", mid) + properties + _utf8(topic), 0x02))
+        return MQTT_ERR_SUCCESS, mid
+
+    def _next_mid(self):
+        """The next packet id (1-65535), skipping ids of QoS 1 publishes still awaiting PUBACK."""
+        for _ in range(65535):
+            self._mid = self._mid % 65535 + 1
+            if self._mid not in self._unacked:
+                return self._mid
+        raise RuntimeError("no free MQTT packet id: 65535 publishes awaiting PUBACK")
+
+    def _send_publish(self, mid, topic, payload, qos, retain, dup=False):
+        name, properties = topic, b""
+        if self.protocol == 5:
+            alias = self._aliases.get(topic)
+            if alias is not None:
+                name = ""  # the broker already knows this alias
+            elif len(self._aliases) < self.alias_maximum:
+                alias = self._aliases[topic] = len(self._aliases) + 1
+            if alias is not None:
+                properties = bytes([TOPIC_ALIAS]) + struct.pack("!H", alias)
+            properties = _varint(len(properties)) + properties
+        body = _utf8(name) + (struct.pack("!H", mid) if qos else b"") + properties + payload
+        self._write(_packet(PUBLISH, body, (0x08 if dup else 0) | (qos << 1) | (1 if retain else 0)))
+
+    def _write(self, data):
+        self._writer.write(data)
+        self._last_sent = time.monotonic()
+
+    async def _report_written(self):
+        """QoS 0 publishes count as published once written out, as with paho."""
+        while self._written:
+            mids, self._written = self._written, []
+            writer = self._writer
+            try:
+                if writer is not None:
+                    await writer.drain()
+            except ConnectionError:
+                pass  # QoS 0 makes no promise; don't hold the publish queue's slots
+            for mid in mids:
+                self._callback(self.on_publish, self, None, mid)
+
+    # -- connection --------------------------------------------------------------
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(self._host, self._port), timeout=10)
+            except (OSError, asyncio.TimeoutError) as e:
+                delay = self._backoff.next()
+                logger.error("❌ MQTT TCP connect error: %s — retrying in %.1fs", e or "timed out", delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self._writer = writer
+            try:
+                self._write(self._connect_packet())
+                rc = await asyncio.wait_for(self._read_connack(reader), timeout=10)
+                if rc == 0:
+                    self._connected = True
+                    self._backoff.reset()
+                    for mid, (topic, payload, qos, retain) in list(self._unacked.items()):
+                        self._send_publish(mid, topic, payload, qos, retain, dup=True)
+                self._callback(self.on_connect, self, None, {"session present": 0}, rc)
+                if rc == 0:
+                    await self._session(reader)
+            except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                logger.debug("MQTT connection ended: %s", e)
+            finally:
+                was_connected, self._connected = self._connected, False
+                self._writer = None
+                writer.close()
+                if was_connected:
+                    self._callback(self.on_disconnect, self, None, 1)
+            await asyncio.sleep(self._backoff.next())
+
+    def _connect_packet(self):
+        flags = 0x02  # clean session
+        if self._username:
+            flags |= 0x80 | (0x40 if self._password is not None else 0)
+        if self._will:
+            _, _, qos, retain = self._will
+            flags |= 0x04 | (qos << 3) | (0x20 if retain else 0)
+
+        body = _utf8("MQTT") + bytes([self.protocol, flags]) + struct.pack("!H", self._keepalive)
+        if self.protocol == 5:
+            body += b"\x00"  # no connect properties
+        body += _utf8(self.client_id)
+        if self._will:
+            topic, payload, _, _ = self._will
+            body += (b"\x00" if self.protocol == 5 else b"") + _utf8(topic) + _utf8(payload)
+        if self._username:
+            body += _utf8(self._username)
+            if self._password is not None:
+                body += _utf8(self._password)
+        return _packet(CONNECT, body)
+
+    async def _read_connack(self, reader):
+        packet_type, _, body = await self._read_packet(reader)
+        if packet_type != CONNACK:
+            raise EOFError(f"expected CONNACK, got packet type {packet_type}")
+        rc = body[1]
+        self._aliases.clear()
+        self.alias_maximum = 0
+        if self.protocol == 5:
+            properties, _ = _read_properties(body, 2)
+            self.alias_maximum = properties.get(TOPIC_ALIAS_MAXIMUM, 0)
+            rc = _CONNACK_V5.get(rc, rc)
+        return rc
+
+    async def _session(self, reader):
+        self._last_received = time.monotonic()
+        pinger = self.loop.create_task(self._keepalive_loop())
+        try:
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+                self._last_received = time.monotonic()
+                self._handle(packet_type, flags, body)
+        finally:
+            pinger.cancel()
+
+    async def _keepalive_loop(self):
+        interval = self._keepalive / 2
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            if now - self._last_received > self._keepalive * 1.5:
+                logger.warning("⚠️ MQTT broker stopped answering, reconnecting")
+                self._writer.close()
+                return
+            if now - self._last_sent >= interval or now - self._last_received >= interval:
+                self._write(_packet(PINGREQ, b""))
+
+    @staticmethod
+    async def _read_packet(reader):
+        header = await reader.readexactly(1)
+        length, shift = 0, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header[0] >> 4, header[0] & 0x0F, await reader.readexactly(length)
+
+    def _handle(self, packet_type, flags, body):
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = _string(body, 0)
+            packet_id = None
+            if qos:
+                packet_id, offset = body[offset:offset + 2], offset + 2
+            if self.protocol == 5:
+                _, offset = _read_properties(body, offset)  # no inbound aliases: we never grant any
+            if qos == 1:
+                self._write(_packet(PUBACK, packet_id))
+            self._callback(self.on_message, self, None, Message(topic, body[offset:], qos, bool(flags & 0x01)))
+
+        elif packet_type == PUBACK:
+            (mid,) = struct.unpack_from("!H", body, 0)
+            if len(body) > 2 and body[2] >= 0x80:
+                logger.warning("⚠️ Broker rejected publish %s (reason 0x%02x)", mid, body[2],
+                               extra={"rate_key": "MQTT publish rejections"})
+            if self._unacked.pop(mid, None) is not None:
+                self._callback(self.on_publish, self, None, mid)
+
+        elif packet_type == SUBACK:
+            codes = body[2:]
+            if self.protocol == 5:
+                _, offset = _read_properties(body, 2)
+                codes = body[offset:]
+            if any(code >= 0x80 for code in codes):
+                logger.error("❌ Broker refused a subscription (codes %s)", list(codes))
+
+        elif packet_type == DISCONNECT:
+            logger.warning("⚠️ Broker closed the MQTT session (reason 0x%02x)", body[0] if body else 0)
+            self._writer.close()
+
+    def _callback(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error("❌ MQTT callback %s failed: %s", getattr(callback, "__name__", callback), e)
+
+
+def _payload_bytes(payload):
+    if payload is None:
+        return b""
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    return str(payload).encode()
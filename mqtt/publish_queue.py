@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import paho.mqtt.client as mqtt
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PublishQueue:
+    """
+    Bounded outbound MQTT buffer drained by a task on the event loop.
+
+    `put()` never blocks: it returns a future that resolves once the broker has
+    accepted the message (PUBACK for QoS 1, socket write for QoS 0). Messages
+    waiting for the same topic are coalesced, so only the latest state is sent.
+    Nothing is sent while the client is disconnected (see `set_connected`): messages
+    wait in the queue instead of failing. QoS 0 messages the client had not written
+    out when the connection dropped are queued again, since no ack will come for them.
+    """
+
+    def __init__(self, client, loop, maxsize=10000, max_inflight=20, flush_interval=0.0):
+        self.client = client
+        self.loop = loop
+        self.maxsize = maxsize
+        self.max_inflight = max_inflight
+        self.flush_interval = flush_interval
+
+        self._pending = OrderedDict()  # topic -> [payload, qos, retain, futures, enqueued_at]
+        self._inflight = {}            # mid -> (futures, sent_at, (topic, payload, qos, retain))
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._wakeup = asyncio.Event()
+        self._connected = asyncio.Event()
+        self._task = None
+
+        self.enqueued = 0
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self.high_water = 0
+        self.ack_count = 0
+        self.ack_latency_total = 0.0
+        self.ack_latency_max = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = self.loop.create_task(self._drain())
+
+    def put(self, topic, payload, qos=0, retain=False):
+        """Queue a message and return a future for its completion. Must be called on the loop."""
+        future = self.loop.create_future()
+        future.add_done_callback(self._log_failure)
+        self.enqueued += 1
+
+        entry = self._pending.get(topic)
+        if entry is not None:
+            # Last write wins: replace the queued payload, complete both futures together
+            entry[0], entry[1], entry[2] = payload, qos, retain
+            entry[3].append(future)
+            self.coalesced += 1
+        else:
+            if len(self._pending) >= self.maxsize:
+                old_topic, old = self._pending.popitem(last=False)
+                self.dropped += 1
+                for f in old[3]:
+                    if not f.done():
+                        f.set_exception(RuntimeError(f"publish queue full, dropped {old_topic}"))
+            self._pending[topic] = [payload, qos, retain, [future], time.monotonic()]
+            self.high_water = max(self.high_water, len(self._pending))
+
+        self._wakeup.set()
+        return future
+
+    def set_connected(self, connected):
+        """Resume or hold sending; called on the loop as the MQTT connection comes and goes."""
+        if connected:
+            self._connected.set()
+            return
+        self._connected.clear()
+        # paho drops unsent packets on reconnect and QoS 0 has no retry, so these would never be
+        # acked and would hold their slots for good; QoS 1 is re-sent by the client and acked later
+        for mid, (futures, _, message) in list(self._inflight.items()):
+            topic, payload, qos, retain = message
+            if qos:
+                continue
+            del self._inflight[mid]
+            self._slots.release()
+            entry = self._pending.get(topic)
+            if entry is not None:
+                entry[3][:0] = futures  # a newer payload is already queued; it completes these too
+            else:
+                self._pending[topic] = [payload, qos, retain, futures, time.monotonic()]
+                self._pending.move_to_end(topic, last=False)
+        self._wakeup.set()
+
+    async def flush(self):
+        """Wait until everything queued so far has been handed to the broker."""
+        futures = [f for entry in self._pending.values() for f in entry[3]]
+        futures += [f for futs, _, _ in self._inflight.values() for f in futs]
+        if futures:
+            await asyncio.gather(*futures, return_exceptions=True)
+
+    def topics(self):
+        """Topics with a publish still queued or awaiting its ack."""
+        return set(self._pending) | {message[0] for _, _, message in self._inflight.values()}
+
+    def on_publish(self, client, userdata, mid, *args):
+        """paho callback (network thread): hand the ack back to the event loop."""
+        self.loop.call_soon_threadsafe(self._on_ack, mid)
+
+    def on_publish_in_loop(self, client, userdata, mid, *args):
+        """Same, for a client whose callbacks already run on the event loop."""
+        self._on_ack(mid)
+
+    def stats(self):
+        return {
+            "depth": len(self._pending),
+            "inflight": len(self._inflight),
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "published": self.published,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "ack_latency_avg": self.ack_latency_total / self.ack_count if self.ack_count else 0.0,
+            "ack_latency_max": self.ack_latency_max,
+        }
+
+    async def _drain(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            if self.flush_interval:
+                # Batch flush policy: let bursts accumulate (and coalesce) before sending
+                await asyncio.sleep(self.flush_interval)
+
+            while self._pending:
+                await self._connected.wait()
+                await self._slots.acquire()
+                if not self._pending:
+                    self._slots.release()
+                    break
+                topic, (payload, qos, retain, futures, _) = self._pending.popitem(last=False)
+                self._send(topic, payload, qos, retain, futures)
+
+    def _send(self, topic, payload, qos, retain, futures):
+        try:
+            info = self.client.publish(topic, payload, qos, retain)
+        except Exception as e:
+            self._fail(futures, e)
+            return
+
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._fail(futures, RuntimeError(f"publish to {topic} failed: {mqtt.error_string(info.rc)}"))
+            return
+
+        self._inflight[info.mid] = (futures, time.monotonic(), (topic, payload, qos, retain))
+
+    def _on_ack(self, mid):
+        entry = self._inflight.pop(mid, None)
+        if entry is None:
+            return  # published outside the queue (e.g. availability from _on_connect)
+        futures, sent_at, _ = entry
+        latency = time.monotonic() - sent_at
+        self.ack_count += 1
+        self.ack_latency_total += latency
+        self.ack_latency_max = max(self.ack_latency_max, latency)
+        metrics.PUBLISH_ACK_SECONDS.observe(latency)
+        self.published += 1
+        self._slots.release()
+        for f in futures:
+            if not f.done():
+                f.set_result(mid)
+
+    def _fail(self, futures, exc):
+        self._slots.release()
+        for f in futures:
+            if not f.done():
+                f.set_exception(exc)
+
+    def _log_failure(self, future):
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            self.failed += 1
+            logger.error("❌ MQTT publish failed: %s", exc, extra={"rate_key": "MQTT publish failures"})
@@ -1,53 +1,172 @@
 import paho.mqtt.client as mqtt
 import json
-from config import MQTT_HOST, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD
-from datetime import datetime
+import hashlib
+from config import MQTT_HOST, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, MQTT_QUEUE_SIZE, MQTT_MAX_INFLIGHT, MQTT_FLUSH_INTERVAL, MQTT_PUBLISH_MODE, GROUP_TOPIC_PREFIX, COMMAND_DEBOUNCE
+from config import CAPABILITY_REFRESH_TOPIC
+from config import MQTT_TRANSPORT, MQTT_PROTOCOL, MQTT_QOS_STATE, MQTT_QOS_DISCOVERY, MQTT_QOS_AVAILABILITY, MQTT_QOS_COMMANDS
 import asyncio
-from coolmaster.client import CoolMasterClient
+import logging
+import time
+import metrics
+from coolmaster.client import CoolMasterClient, PRIORITY_COMMAND, expected_state
+from coolmaster.command_coalescer import CommandCoalescer
+from coolmaster.unit_state import ALL_FIELDS, THERMOSTAT, TEMPERATURE, IS_ON, HVAC_MODE, FAN_MODE, STATUS, HAS_ERROR, STATE, StatusTable
+from mqtt.async_client import AsyncMQTTClient
+from mqtt.publish_queue import PublishQueue
+
+# Attribute topic -> mask of the unit fields that feed it (MQTT_PUBLISH_MODE=attributes)
+ATTRIBUTE_FIELDS = {
+    "temperature": THERMOSTAT,
+    "current_temperature": TEMPERATURE,
+    "hvac_mode": IS_ON | HVAC_MODE,
+    "fan_mode": FAN_MODE,
+    "status": STATUS,
+    "has_error": HAS_ERROR,
+    "state": STATE,
+}
+
+logger = logging.getLogger(__name__)
+
+BRIDGE_STATUS_TOPIC = "homeassistant/climate/coolmaster/status"  # the bridge itself; also its last will
+RETAINED_CHECK_TOPIC = "homeassistant/climate/+/config"  # retained climate discovery, read back on connect
+RETAINED_CHECK_DELAY = 2.0  # seconds to collect it before comparing
+
+
+def controller_status_topic(name):
+    """Availability of one CoolMasterNet controller, as seen by the bridge."""
+    return f"homeassistant/climate/coolmaster/{name or 'controller'}/status"
+
 
 class MQTTPublisher:
     def __init__(self, coolmaster_client,loop):
         self.coolmaster = coolmaster_client  # ✅ store reference
         self.loop = loop
-        self.client = mqtt.Client()
+        self.last_status = StatusTable()  # uid -> last published UnitState, shared with the poll loop
+        self.status_handler = None   # callable(status): diff against last_status and publish
+        self.command_listener = None # callable(uid): told whenever a command is sent to a unit
+        self.discovery_hashes = {}   # discovery topic -> sha1 of the retained payload last sent
+        self._discovery = {}         # uid -> {discovery topic: serialized payload}
+        self._retained = None        # climate discovery topic -> sha1 the broker holds, while checking after a connect
+        self.publish_mode = MQTT_PUBLISH_MODE  # "json": one state document, "attributes": one topic per changed field
+        self.commands = CommandCoalescer(COMMAND_DEBOUNCE, self.coolmaster.send_command)
+        self._tasks = set()          # command handlers started on the loop by the asyncio transport
+
+        self.native = MQTT_TRANSPORT == "asyncio"
+        if self.native:
+            self.client = AsyncMQTTClient(loop, protocol=MQTT_PROTOCOL)
+        else:
+            if MQTT_PROTOCOL == 5:
+                logger.warning("⚠️ MQTT_PROTOCOL=5 needs MQTT_TRANSPORT=asyncio, using MQTT 3.1.1")
+            self.client = mqtt.Client()
+        self.transport = f"{'asyncio' if self.native else 'paho'}, MQTT {'5' if self.native and MQTT_PROTOCOL == 5 else '3.1.1'}"
         self.client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
+        self.client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
+
+        # Outbound publishes go through a bounded queue drained on the loop, never wait_for_publish()
+        self.queue = PublishQueue(self.client, loop, MQTT_QUEUE_SIZE, MQTT_MAX_INFLIGHT, MQTT_FLUSH_INTERVAL)
+        self.client.on_publish = self.queue.on_publish_in_loop if self.native else self.queue.on_publish
+        self.queue.start()
+        metrics.PUBLISH_QUEUE_DEPTH.set_function(lambda: len(self.queue._pending))
+        metrics.PUBLISH_INFLIGHT.set_function(lambda: len(self.queue._inflight))
+        metrics.PUBLISH_DROPPED.set_function(lambda: self.queue.dropped)
         self.client.will_set(
-            topic="homeassistant/climate/coolmaster/status",  # availability topic
+            topic=BRIDGE_STATUS_TOPIC,                                # availability topic
             payload="offline",                                        # will payload
-            qos=0,
+            qos=MQTT_QOS_AVAILABILITY,
             retain=True                                               # retain so HA sees it on restart
         )
 
         try:
-            print(f"{datetime.now().strftime('%H:%M:%S')}🔌 Connecting to MQTT at {MQTT_HOST}:{MQTT_PORT}...")
-            self.client.connect(MQTT_HOST, MQTT_PORT, keepalive=60)
+            logger.info("🔌 Connecting to MQTT at %s:%s (%s)...", MQTT_HOST, MQTT_PORT, self.transport)
+            # Connects in the background and keeps retrying, so a broker that isn't up yet is picked up later
+            self.client.connect_async(MQTT_HOST, MQTT_PORT, keepalive=60)
             self.client.loop_start()
         except Exception as e:
-            print(f"{datetime.now().strftime('%H:%M:%S')} ❌ MQTT TCP connect error: {e}")
+            logger.error("❌ MQTT TCP connect error: %s", e)
 
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            print(f"{datetime.now().strftime('%H:%M:%S')} ✅ MQTT connected successfully")
+            logger.info("✅ MQTT connected successfully")
             #subscribe to the climate entities command topics.
-            self.client.subscribe("homeassistant/climate/+/set/temperature")
-            self.client.subscribe("homeassistant/climate/+/set/mode")
-            self.client.subscribe("homeassistant/climate/+/set/fan_mode")
+            self.client.subscribe("homeassistant/climate/+/set/temperature", MQTT_QOS_COMMANDS)
+            self.client.subscribe("homeassistant/climate/+/set/mode", MQTT_QOS_COMMANDS)
+            self.client.subscribe("homeassistant/climate/+/set/fan_mode", MQTT_QOS_COMMANDS)
+            self.client.subscribe(f"{GROUP_TOPIC_PREFIX}/+/set/+", MQTT_QOS_COMMANDS)
+            self.client.subscribe(CAPABILITY_REFRESH_TOPIC, MQTT_QOS_COMMANDS)
             self.client.on_message = self._on_message
 
             #Tell everyone where are Online
-            self.client.publish("homeassistant/climate/coolmaster/status", "online", retain=True)
-            print(f"{datetime.now().strftime('%H:%M:%S')} ✅ Published availability → 'online' (retain=True)")
+            self.client.publish(BRIDGE_STATUS_TOPIC, "online", qos=MQTT_QOS_AVAILABILITY, retain=True)
+            logger.info("✅ Published availability → 'online' (retain=True)")
+
+            # The broker may have lost its retained messages (restart without persistence): check what it still has
+            self.loop.call_soon_threadsafe(self._resync)
 
        
         elif rc == 4:
-            print(f"{datetime.now().strftime('%H:%M:%S')} ❌ MQTT authentication failed (bad username/password)")
+            logger.error("❌ MQTT authentication failed (bad username/password)")
         else:
-            print(f"{datetime.now().strftime('%H:%M:%S')} ❌ MQTT connection failed with result code {rc}")
+            logger.error("❌ MQTT connection failed with result code %s", rc)
 
     def _on_disconnect(self, client, userdata, rc):
-        print(f"{datetime.now().strftime('%H:%M:%S')} ⚠️ Disconnected from MQTT (code {rc})")
+        logger.warning("⚠️ Disconnected from MQTT (code %s)", rc)
+        self.loop.call_soon_threadsafe(self.queue.set_connected, False)
+
+    def _resync(self):
+        """
+        Resume the publish queue and check the broker still has the discovery we sent. Nothing else is
+        re-sent up front: the retained climate documents come back through a short-lived subscription,
+        and only units whose document is missing or different are published again.
+        """
+        queued = self.queue.topics()
+        self.queue.set_connected(True)
+        for controller in self.coolmaster.controllers:
+            if controller.client.supervisor.available is not None:
+                self.publish_controller_availability(controller.name, controller.client.supervisor.available)
+
+        # Documents still in the queue are on their way; the rest the broker should be holding
+        expected = {topic: digest for topic, digest in self.discovery_hashes.items()
+                    if topic.startswith("homeassistant/climate/") and topic not in queued}
+        self._retained = None
+        if not expected:
+            return
+        self._retained = retained = {}
+        self.client.subscribe(RETAINED_CHECK_TOPIC, MQTT_QOS_DISCOVERY)
+        self.loop.call_later(RETAINED_CHECK_DELAY, self._check_retained, expected, retained)
+
+    def _note_retained(self, topic, digest):
+        if self._retained is not None:
+            self._retained[topic] = digest
+
+    def _check_retained(self, expected, retained):
+        """Publish discovery again, and state on the next poll, for units whose climate document the broker lost."""
+        if self._retained is not retained or not self.client.is_connected():
+            return  # reconnected or disconnected since: the next connect runs its own check
+        self._retained = None
+        self.client.unsubscribe(RETAINED_CHECK_TOPIC)
+
+        lost = []
+        for uid in (uid for controller in self.coolmaster.controllers for uid in controller.unit_ids):
+            topic = f"homeassistant/climate/coolmaster_{uid.replace('.', '_')}/config"
+            digest = expected.get(topic)
+            # Skip units republished since the check started; their new document is on its way
+            if digest is not None and retained.get(topic) != digest and self.discovery_hashes.get(topic) == digest:
+                lost.append(uid)
+        if not lost:
+            return
+        logger.info("📤 Broker is missing discovery of %d units, publishing them again", len(lost))
+        for uid in lost:
+            for topic in self._discovery_for(uid):
+                self.discovery_hashes.pop(topic, None)
+            self.publish_climate_config(uid)
+            self.last_status.discard(uid)  # the broker lost its state too: the next poll publishes it in full
+        self.coolmaster.reread(lost)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Queue a publish without blocking the event loop; returns a completion future."""
+        return self.queue.put(topic, payload, qos, retain)
 
     def get_known_unit_ids(self):
         # If you've already discovered them during init, store them
@@ -55,183 +174,304 @@ class MQTTPublisher:
         return getattr(self, "_unit_ids", [])
 
 
-    def publish_climate_state(self, unit):
-        safe_uid = unit['uid'].replace('.', '_')
-        topic = f"homeassistant/climate/coolmaster_{safe_uid}/state"
+    def publish_controller_availability(self, name, available):
+        """Mark every unit of controller `name` available or unavailable in HA."""
+        logger.info("📶 Controller %s → %s", name or "controller", "online" if available else "offline")
+        self.publish(controller_status_topic(name), "online" if available else "offline", MQTT_QOS_AVAILABILITY, retain=True)
 
-        payload = {
-            "temperature": unit["thermostat"],             # setpoint
-            "current_temperature": unit["temperature"],    # actual room temp
-           "hvac_mode": "off" if not unit["is_on"] else unit["hvac_mode"],
-            "fan_mode": unit["fan_mode"],
-           # "state": "cooling" if unit["is_on"] else "off",
-            "status": unit["status"],
-            "state": unit["state"]
+    def publish_climate_state(self, unit, changed=ALL_FIELDS):
+        """Publish a unit's state; in attributes mode only the topics fed by the `changed` field mask are sent."""
+        safe_uid = unit.uid.replace('.', '_')
+        topic = f"homeassistant/climate/coolmaster_{safe_uid}/state"
+        payload = self._state_payload(unit)
+
+        if self.publish_mode == "attributes":
+            base = f"homeassistant/climate/coolmaster_{safe_uid}"
+            for attr, fields in ATTRIBUTE_FIELDS.items():
+                if not changed & fields:
+                    continue
+                value = payload[attr]
+                if isinstance(value, bool):
+                    value = "ON" if value else "OFF"
+                self.publish(f"{base}/{attr}", str(value), MQTT_QOS_STATE, retain=True)
+            return
+
+        self.publish(topic, json.dumps(payload), MQTT_QOS_STATE, retain=True)
+
+    def _state_payload(self, unit):
+        return {
+            "temperature": unit.thermostat,             # setpoint
+            "current_temperature": unit.temperature,    # actual room temp
+           "hvac_mode": "off" if not unit.is_on else unit.hvac_mode,
+            "fan_mode": unit.fan_mode,
+           # "state": "cooling" if unit.is_on else "off",
+            "status": unit.status,
+            "has_error": unit.has_error,                # drives the problem binary_sensor, no config rewrite
+            "state": unit.state
         }
 
-        self.client.publish(topic, json.dumps(payload), retain=True).wait_for_publish()
-
-        #update icon
-        error_icon = "mdi:alert-circle" if unit["has_error"] else "mdi:check"       
-        error_topic = f"homeassistant/sensor/coolmaster_{safe_uid}_status/config"
-        error_payload = {
-            "name": f"Status",
-            "unique_id": f"coolmaster_{safe_uid}_status",
-            "state_topic": f"homeassistant/climate/coolmaster_{safe_uid}/state",
-            "availability_topic" : "homeassistant/climate/coolmaster/status" ,
-            "value_template": "{{ value_json.status }}",
-            "icon" : error_icon, 
-            "device": {
-                "identifiers": [f"coolmaster_{safe_uid}"],
-                "name": f"CoolMaster HVAC {safe_uid}",
-                "manufacturer": "CoolAutomation",
-                "model": "CoolMasterNet",
-                "sw_version": "Coolmaster-MQTT Bridge 1.0"
-            }
-        }  
-
-        # Publish main climate state
-        self.client.publish(error_topic, json.dumps(error_payload), retain=True).wait_for_publish()
+    def publish_climate_config(self, uid, rebuild=False):
+        """
+        Publish the unit's discovery documents, skipping any whose content was already sent.
+        `rebuild` regenerates them first, e.g. after the unit's capabilities changed.
+        """
+        if rebuild:
+            self._discovery.pop(uid, None)
+        for topic, body in self._discovery_for(uid).items():
+            digest = hashlib.sha1(body.encode()).hexdigest()
+            if self.discovery_hashes.get(topic) == digest:
+                continue
+            self.discovery_hashes[topic] = digest
+            future = self.publish(topic, body, MQTT_QOS_DISCOVERY, True)
+            future.add_done_callback(lambda f, t=topic, d=digest: self._forget_failed_discovery(f, t, d))
+
+    def _forget_failed_discovery(self, future, topic, digest):
+        """A discovery publish that never reached the broker must be retried next time."""
+        if (future.cancelled() or future.exception()) and self.discovery_hashes.get(topic) == digest:
+            del self.discovery_hashes[topic]
+
+    def _discovery_for(self, uid):
+        """Build (once) and cache the serialized discovery payloads for a unit, keyed by topic."""
+        if uid not in self._discovery:
+            self._discovery[uid] = {topic: json.dumps(payload) for topic, payload in self._build_discovery(uid).items()}
+        return self._discovery[uid]
+
+    def _build_discovery(self, uid):
+        safe_uid = uid.replace('.', '_')
+        object_id = f"coolmaster_{safe_uid}"
+        state_topic = f"homeassistant/climate/{object_id}/state"
+        caps = self.coolmaster.capabilities_for(uid)
+        device = {
+            "identifiers": [f"coolmaster_{safe_uid}"],
+            "name": f"CoolMaster HVAC {safe_uid}",
+            "manufacturer": "CoolAutomation",
+            "model": "CoolMasterNet",
+            "sw_version": "Coolmaster-MQTT Bridge 1.0"
+        }
 
+        # Units go unavailable when either the bridge or their own controller is offline
+        availability = {
+            "availability": [
+                {"topic": BRIDGE_STATUS_TOPIC},
+                {"topic": controller_status_topic(self.coolmaster.controller_for(uid).name)},
+            ],
+            "availability_mode": "all",
+        }
 
+        def source(attr, topic_key="state_topic", template_key="value_template", template=None):
+            """Where HA reads `attr`: its own raw topic, or a template over the JSON state document."""
+            if self.publish_mode == "attributes":
+                return {topic_key: f"homeassistant/climate/{object_id}/{attr}"}
+            return {topic_key: state_topic, template_key: template or f"{{{{ value_json.{attr} }}}}"}
 
-    def publish_climate_config(self, uid):
-        safe_uid = uid.replace('.', '_')
-        object_id = f"coolmaster_{safe_uid}"
+        configs = {}
 
-        error_topic = f"homeassistant/sensor/{object_id}_status/config"
-        error_payload = {
+        configs[f"homeassistant/sensor/{object_id}_status/config"] = {
                 "name": f"Status",
                 "unique_id": f"coolmaster_{safe_uid}_status",
-                "state_topic": f"homeassistant/climate/coolmaster_{safe_uid}/state",
-                "value_template": "{{ value_json.status }}",
-                "availability_topic" : "homeassistant/climate/coolmaster/status" ,
-                "icon" : "mdi:check", 
-                "device": {
-                    "identifiers": [f"coolmaster_{safe_uid}"],
-                    "name": f"CoolMaster HVAC {safe_uid}",
-                    "manufacturer": "CoolAutomation",
-                    "model": "CoolMasterNet",
-                    "sw_version": "Coolmaster-MQTT Bridge 1.0"
-                }
+                **source("status"),
+                **availability,
+                "icon" : "mdi:check",
+                "device": device
             }
-        self.client.publish(error_topic, json.dumps(error_payload),0,True).wait_for_publish()
 
+        # Error indicator: HA derives the icon from the state, so it never needs a config rewrite
+        configs[f"homeassistant/binary_sensor/{object_id}_problem/config"] = {
+                "name": f"Problem",
+                "unique_id": f"coolmaster_{safe_uid}_problem",
+                **source("has_error", template="{{ 'ON' if value_json.has_error else 'OFF' }}"),
+                **availability,
+                "device_class" : "problem",
+                "device": device
+            }
 
-        temp_topic = f"homeassistant/sensor/{object_id}_temp/config"
-        temp_payload = {
+        configs[f"homeassistant/sensor/{object_id}_temp/config"] = {
                 "name": f"Current Temperature",
                 "unique_id": f"coolmaster_{safe_uid}_temp",
-                "state_topic": f"homeassistant/climate/coolmaster_{safe_uid}/state",
-                "value_template": "{{ value_json.current_temperature }}",
-                "availability_topic" : "homeassistant/climate/coolmaster/status" ,
-                "icon" : "mdi:thermometer", 
+                **source("current_temperature"),
+                **availability,
+                "icon" : "mdi:thermometer",
                 "device_class" : "temperature",
                 "unit_of_measurement": "°C" ,
-                "device": {
-                    "identifiers": [f"coolmaster_{safe_uid}"],
-                    "name": f"CoolMaster HVAC {safe_uid}",
-                    "manufacturer": "CoolAutomation",
-                    "model": "CoolMasterNet",
-                    "sw_version": "Coolmaster-MQTT Bridge 1.0"
-                }
+                "device": device
             }
-        self.client.publish(temp_topic, json.dumps(temp_payload),0,True).wait_for_publish()
 
-
-        state_topic = f"homeassistant/sensor/{object_id}_state/config"
-        state_payload = {
+        configs[f"homeassistant/sensor/{object_id}_state/config"] = {
                 "name": f"HVAC State",
                 "unique_id": f"coolmaster_{safe_uid}_state",
-                "state_topic": f"homeassistant/climate/coolmaster_{safe_uid}/state",
-                "availability_topic" : "homeassistant/climate/coolmaster/status" ,
-                "value_template": "{{ value_json.state }}",
-                "icon" : "mdi:weather-dust", 
-                "device": {
-                    "identifiers": [f"coolmaster_{safe_uid}"],
-                    "name": f"CoolMaster HVAC {safe_uid}",
-                    "manufacturer": "CoolAutomation",
-                    "model": "CoolMasterNet",
-                    "sw_version": "Coolmaster-MQTT Bridge 1.0"
-                }
+                **source("state"),
+                **availability,
+                "icon" : "mdi:weather-dust",
+                "device": device
             }
-        self.client.publish(state_topic, json.dumps(state_payload),0,True).wait_for_publish()
-
 
-        topic = f"homeassistant/climate/{object_id}/config"
-        payload = {
+        configs[f"homeassistant/climate/{object_id}/config"] = {
             "name": f"CoolMaster {uid}",
             "unique_id": object_id,
-            "availability_topic" : "homeassistant/climate/coolmaster/status" ,
-            "state_topic": f"homeassistant/climate/coolmaster_{safe_uid}/state",
-            "current_temperature_topic": f"homeassistant/climate/coolmaster_{safe_uid}/state",
-            "current_temperature_template": "{{ value_json.current_temperature }}",
+            **availability,
+            **({} if self.publish_mode == "attributes" else {"state_topic": state_topic}),
+            **source("current_temperature", "current_temperature_topic", "current_temperature_template"),
             "temperature_command_topic": f"homeassistant/climate/coolmaster_{safe_uid}/set/temperature",
-            "temperature_state_topic" :  f"homeassistant/climate/coolmaster_{safe_uid}/state",
-            "temperature_state_template" : "{{ value_json.temperature }}",
+            **source("temperature", "temperature_state_topic", "temperature_state_template"),
             "mode_command_topic": f"homeassistant/climate/coolmaster_{safe_uid}/set/mode",
-            "mode_state_topic" :  f"homeassistant/climate/coolmaster_{safe_uid}/state",
-            "mode_state_template" : "{{ value_json.hvac_mode }}",
-            "fan_mode_command_topic": f"homeassistant/climate/coolmaster_{safe_uid}/set/fan_mode",
-            "fan_mode_state_topic": f"homeassistant/climate/coolmaster_{safe_uid}/state",
-            "fan_mode_state_template": "{{ value_json.fan_mode }}",
-            "modes": ["off", "cool"],
-            "fan_modes": ["auto", "low", "medium", "high"],
+            **source("hvac_mode", "mode_state_topic", "mode_state_template"),
+            **({
+                "fan_mode_command_topic": f"homeassistant/climate/coolmaster_{safe_uid}/set/fan_mode",
+                **source("fan_mode", "fan_mode_state_topic", "fan_mode_state_template"),
+                "fan_modes": list(caps.fan_speeds),
+            } if caps.fan_speeds else {}),
+            "modes": ["off", *caps.modes],
             "temperature_unit": "C",
-            "min_temp": 16,
-            "max_temp": 28,
+            "min_temp": caps.min_temp,
+            "max_temp": caps.max_temp,
             "retain": False,
-            "device": {
-                "identifiers": [f"coolmaster_{safe_uid}"],
-                "name": f"CoolMaster HVAC {safe_uid}",
-                "manufacturer": "CoolAutomation",
-                "model": "CoolMasterNet",
-                "sw_version": "Coolmaster-MQTT Bridge 1.0"
-            }
+            "device": device
         }
 
-        self.client.publish(topic, json.dumps(payload),0,True).wait_for_publish()
+        return configs
 
     def _on_message(self, client, userdata, msg):
+        received_at = time.monotonic()
         topic = msg.topic
+        if topic.startswith("homeassistant/climate/") and topic.endswith("/config"):
+            # Discovery read back for the connect check, not a command
+            if msg.retain:
+                self.loop.call_soon_threadsafe(self._note_retained, topic, hashlib.sha1(msg.payload).hexdigest())
+            return
         payload = msg.payload.decode()
-        print(f"{datetime.now().strftime('%H:%M:%S')} 📨 MQTT command: {topic} = {payload}")
+        logger.info("📨 MQTT command: %s = %s", topic, payload, extra={"rate_key": f"commands on {topic}"})
 
         try:
             parts = topic.split("/")
-            if len(parts) >= 5 and parts[2].startswith("coolmaster_"):
+            if topic == CAPABILITY_REFRESH_TOPIC:
+                self._run_on_loop(self.handle_capability_refresh(payload))
+
+            elif topic.startswith(GROUP_TOPIC_PREFIX + "/"):
+                group, _, command_type = topic[len(GROUP_TOPIC_PREFIX) + 1:].split("/", 2)
+                self._run_on_loop(self.handle_group_command(group, command_type, payload, received_at))
+
+            elif len(parts) >= 5 and parts[2].startswith("coolmaster_"):
                 uid = parts[2].replace("coolmaster_", "").replace("_", ".")
                 command_type = parts[4]  # "temperature", "mode", "fan_mode"
 
-                asyncio.run_coroutine_threadsafe(
-                    self.handle_command(uid, command_type, payload),
-                    self.loop
-                )
-                
+                self._run_on_loop(self.handle_command(uid, command_type, payload, received_at))
+
             else:
-                print(f"{datetime.now().strftime('%H:%M:%S')} ⚠️ Ignored unmatched topic: {topic}")
+                logger.warning("⚠️ Ignored unmatched topic: %s", topic, extra={"rate_key": "unmatched command topics"})
         except Exception as e:
-            print(f"{datetime.now().strftime('%H:%M:%S')} ❌ Failed to handle command: {e}")
-
+            logger.error("❌ Failed to handle command: %s", e)
+
+    def _run_on_loop(self, coro):
+        """Start a command handler: directly with the asyncio transport, via the loop's thread-safe queue with paho."""
+        if self.native:
+            task = self.loop.create_task(coro)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, self.loop)
 
-    async def handle_command(self, uid: str, command_type: str, value: str):
+    async def handle_command(self, uid: str, command_type: str, value: str, received_at=None):
         try:
-            if command_type == "temperature":
-                temp = float(value)
-                print(f"{datetime.now().strftime('%H:%M:%S')} 🌡️ Set {uid} temperature → {temp}")
-                await self.coolmaster.set_thermostat(uid, temp)
+            if command_type not in ("temperature", "mode", "fan_mode"):
+                logger.warning("⚠️ Unknown command type: %s", command_type)
+                return
+
+            # Rejected here rather than by the controller, without a round-trip
+            try:
+                self.coolmaster.capabilities_for(uid).check(command_type, value)
+            except ValueError as e:
+                metrics.COMMANDS_SKIPPED.inc(reason="unsupported")
+                logger.warning("⚠️ Rejected %s %s=%s: %s", uid, command_type, value, e,
+                               extra={"rate_key": f"unsupported commands for {uid}"})
+                return
+
+            # The state before this command, for dedup, since the optimistic publish below overwrites it
+            current = self.last_status.get(uid)
+            current = current.copy() if current is not None else None
+
+            # Show the expected result in HA straight away, the refresh below confirms it
+            self._publish_optimistic(uid, command_type, value)
+
+            if not await self.commands.submit(uid, command_type, value, current):
+                logger.debug("🔁 %s %s=%s not sent: superseded or already in effect", uid, command_type, value)
+                return
+
+            if received_at is not None:
+                metrics.COMMAND_SECONDS.observe(time.monotonic() - received_at, command=command_type)
+            if self.command_listener:
+                self.command_listener(uid)
+            await self._refresh_unit(uid)
 
-            elif command_type == "mode":
-                print(f"{datetime.now().strftime('%H:%M:%S')} ❄️ Set {uid} mode → {value}")
-                await self.coolmaster.set_mode(uid, value)
-
-            elif command_type == "fan_mode":
-                print(f"{datetime.now().strftime('%H:%M:%S')} 💨 Set {uid} fan → {value}")
-                await self.coolmaster.set_fan_speed(uid, value)
+        except Exception as e:
+            logger.error("❌ Command failed [%s, %s, %s]: %s", uid, command_type, value, e)
 
+    async def handle_group_command(self, group: str, command_type: str, value: str, received_at=None):
+        """Run a command on every unit of a group and report the per-unit outcome on <group>/result."""
+        result_topic = f"{GROUP_TOPIC_PREFIX}/{group}/result"
+        try:
+            members = self.coolmaster.group_members(group)
+            results = await self.coolmaster.run_group(members, command_type, value, self.last_status)
+        except Exception as e:
+            logger.error("❌ Group command failed [%s, %s, %s]: %s", group, command_type, value, e)
+            self.publish(result_topic, json.dumps({"command": command_type, "value": value, "error": str(e)}), MQTT_QOS_COMMANDS)
+            return
+
+        sent = [uid for uid, outcome in results.items() if outcome == "ok"]
+        failed = {uid: outcome for uid, outcome in results.items() if outcome not in ("ok", "unchanged")}
+        if received_at is not None:
+            metrics.COMMAND_SECONDS.observe(time.monotonic() - received_at, command=f"group_{command_type}")
+        for uid in sent:
+            self._publish_optimistic(uid, command_type, value)
+            if self.command_listener:
+                self.command_listener(uid)  # the next poll re-reads them; their cached lines were dropped
+
+        logger.info("👥 Group %s %s → %s: %d sent, %d unchanged, %d failed", group, command_type, value,
+                    len(sent), len(results) - len(sent) - len(failed), len(failed))
+        for uid, error in failed.items():
+            logger.warning("⚠️ Group %s: %s rejected %s=%s: %s", group, uid, command_type, value, error,
+                           extra={"rate_key": f"group {group} failures"})
+
+        self.publish(result_topic, json.dumps({
+            "command": command_type,
+            "value": value,
+            "ok": sent,
+            "unchanged": [uid for uid, outcome in results.items() if outcome == "unchanged"],
+            "failed": failed,
+        }), MQTT_QOS_COMMANDS)
+
+    async def handle_capability_refresh(self, target: str):
+        """Mark a unit, a group or (empty payload) every unit for a capability re-read by its poll loop."""
+        target = target.strip() or "all"
+        try:
+            if target == "all" or target in self.coolmaster.groups:
+                uids = self.coolmaster.group_members(target)
             else:
-                print(f"{datetime.now().strftime('%H:%M:%S')} ⚠️ Unknown command type: {command_type}")
-
+                uids = [target]
+            self.coolmaster.invalidate_capabilities(uids)
         except Exception as e:
-            print(f"{datetime.now().strftime('%H:%M:%S')} ❌ Command failed [{uid}, {command_type}, {value}]: {e}")
+            logger.error("❌ Capability refresh for %s failed: %s", target, e)
+            return
+        logger.info("🔍 Re-reading capabilities of %d unit(s) for %s", len(uids), target)
 
+    def _publish_optimistic(self, uid, command_type, value):
+        """Publish the state the unit should be in once the command lands."""
+        last = self.last_status.get(uid)
+        if last is None or not self.status_handler:
+            return
+
+        try:
+            self.coolmaster.capabilities_for(uid).check(command_type, value)
+        except ValueError:
+            return  # the unit will refuse it, nothing to predict
+        self.status_handler(expected_state(last, command_type, value))
+
+    async def _refresh_unit(self, uid):
+        """Read back a single unit ahead of the poll queue and reconcile it with the cache."""
+        if not self.status_handler:
+            return
+        try:
+            status = await self.coolmaster.get_status(uid, priority=PRIORITY_COMMAND)
+        except Exception as e:
+            logger.warning("⚠️ Refresh of %s failed, next poll will reconcile: %s", uid, e)
+            return
+        self.status_handler(status)
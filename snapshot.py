@@ -0,0 +1,95 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from coolmaster.unit_state import FIELDS, UnitState
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+def capture(controllers, mqtt, last_status):
+    """What a restart needs to pick up where this run left off."""
+    return {
+        "version": VERSION,
+        "publish_mode": mqtt.publish_mode,
+        "controllers": {c.name: list(c.unit_ids) for c in controllers},
+        "units": {row.uid: [getattr(row, name) for name in FIELDS[1:]] for row in last_status.rows()},
+        "discovery": dict(mqtt.discovery_hashes),
+        "capabilities": {uid: values for c in controllers for uid, values in c.capabilities.dump().items()},
+    }
+
+
+def save(path, state):
+    """Write the snapshot atomically, so a crash mid-write keeps the previous one."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({**state, "saved_at": round(time.time())}, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load(path):
+    """The saved snapshot, or None if there is none or it can't be used."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("⚠️ Ignoring unreadable snapshot %s: %s", path, e)
+        return None
+    if state.get("version") != VERSION:
+        logger.warning("⚠️ Ignoring snapshot %s from another version", path)
+        return None
+    return state
+
+
+def restore(state, controllers, mqtt, last_status):
+    """
+    Seed unit lists, last published state, capabilities and discovery hashes; returns the controllers
+    that got units back. Published state and hashes are only kept if the publish mode hasn't changed.
+    """
+    restored = []
+    for controller in controllers:
+        unit_ids = state["controllers"].get(controller.name)
+        if unit_ids:
+            controller.unit_ids = list(unit_ids)
+            restored.append(controller)
+
+    known = {uid for controller in restored for uid in controller.unit_ids}
+    last_status.reserve(uid for controller in restored for uid in controller.unit_ids)
+    capabilities = state.get("capabilities", {})
+    for controller in restored:
+        controller.capabilities.load({uid: capabilities[uid] for uid in controller.unit_ids if uid in capabilities})
+
+    # State and discovery were published for the other mode's topics: publish everything afresh
+    if state.get("publish_mode") != mqtt.publish_mode:
+        logger.info("💾 Snapshot was taken with MQTT_PUBLISH_MODE=%s, not restoring published state",
+                    state.get("publish_mode", "json"))
+        return restored
+    for uid, values in state["units"].items():
+        if uid in known:
+            last_status.store(UnitState(uid, *values))
+    mqtt.discovery_hashes.update(state["discovery"])
+
+    age = time.time() - state.get("saved_at", time.time())
+    logger.info("💾 Restored %d units from a snapshot %.0fs old", len(last_status), age)
+    return restored
+
+
+async def save_forever(path, interval, capture_state):
+    """Every `interval` seconds, save `capture_state()` if it differs from what was saved last."""
+    saved = None
+    while True:
+        await asyncio.sleep(interval)
+        state = capture_state()
+        if state == saved:
+            continue
+        try:
+            save(path, state)
+            saved = state
+        except OSError as e:
+            logger.error("❌ Saving snapshot to %s failed: %s", path, e, extra={"rate_key": "snapshot failures"})
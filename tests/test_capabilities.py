@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from coolmaster.capabilities import DEFAULT, CapabilityCache, UnitCapabilities, parse_props
+
+
+def test_parse_props():
+    caps = parse_props(
+        "L1.001 Name     -\r\n"
+        "       Modes    +Cool -Heat -Auto +Dry +Fan\r\n"
+        "       Fspeeds  +L +M +H -A\r\n"
+        "       Limits   18-30\r\n",
+        fetched_at=100.0,
+    )
+    assert caps.modes == ("cool", "dry", "fan")
+    assert caps.fan_speeds == ("low", "medium", "high")
+    assert (caps.min_temp, caps.max_temp, caps.fetched_at) == (18.0, 30.0, 100.0)
+
+
+def test_parse_props_widens_per_mode_limits_and_keeps_missing_defaults():
+    caps = parse_props("Limits: cool 18-30 heat 10-26\n", fetched_at=1.0)
+    assert (caps.min_temp, caps.max_temp) == (10.0, 30.0)
+    assert (caps.modes, caps.fan_speeds) == (DEFAULT.modes, DEFAULT.fan_speeds)
+
+
+@pytest.mark.parametrize("text", ["", "Unknown command\r\n", "L1.001 Name -\r\n"])
+def test_parse_props_without_fields(text):
+    assert parse_props(text) is None
+
+
+def _caps(fetched_at, modes=("cool", "heat")):
+    return UnitCapabilities(modes, ("low", "high"), 16, 30, fetched_at)
+
+
+def test_cache_reads_units_once_until_they_expire():
+    cache = CapabilityCache(ttl=60)
+    assert cache.stale(["L1.001", "L1.002"]) == ["L1.001", "L1.002"]
+    assert cache.get("L1.001") is DEFAULT
+    cache.store("L1.001", _caps(time.time()))
+    cache.store("L1.002", _caps(time.time() - 61))
+    assert cache.stale(["L1.001", "L1.002"]) == ["L1.002"]
+
+
+def test_cache_store_reports_whether_discovery_needs_rebuilding():
+    cache = CapabilityCache()
+    assert cache.store("L1.001", _caps(1.0))
+    assert not cache.store("L1.001", _caps(2.0))  # re-read, same values
+    assert cache.store("L1.001", _caps(3.0, modes=("cool",)))
+
+
+def test_invalidate_keeps_values_until_reread():
+    cache = CapabilityCache(ttl=0)
+    cache.store("L1.001", _caps(time.time()))
+    cache.store("L1.002", _caps(time.time()))
+    assert cache.stale(["L1.001", "L1.002"]) == []
+    cache.invalidate(["L1.001"])
+    assert cache.stale(["L1.001", "L1.002"]) == ["L1.001"]
+    assert cache.get("L1.001").modes == ("cool", "heat")
+    cache.invalidate()
+    assert cache.stale(["L1.001", "L1.002"]) == ["L1.001", "L1.002"]
+
+
+def test_dump_and_load_round_trip():
+    cache = CapabilityCache()
+    cache.store("L1.001", _caps(123.0))
+    restored = CapabilityCache()
+    restored.load(cache.dump())
+    assert restored.get("L1.001") == cache.get("L1.001")
+    assert restored.get("L1.001").fetched_at == 123.0
+
+
+def test_check_rejects_what_the_unit_cannot_do():
+    caps = _caps(1.0, modes=("cool",))
+    caps.check("mode", "Off")
+    caps.check("temperature", "16")
+    with pytest.raises(ValueError, match="unsupported mode"):
+        caps.check("mode", "heat")
+    with pytest.raises(ValueError, match="outside 16-30"):
+        caps.check("temperature", "31")
+    with pytest.raises(ValueError, match="unsupported fan_mode"):
+        caps.check("fan_mode", "auto")
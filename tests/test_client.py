@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from bench.simulator import CoolMasterSimulator
+from coolmaster.client import PRIORITY_COMMAND, PRIORITY_POLL, CoolMasterClient
+from coolmaster.unit_state import UnitState
+
+
+def _run_against_simulator(test, client_args=None, **simulator_args):
+    """Run `test(client, simulator)` against a simulated controller; returns the verbs it received, in order."""
+    async def run():
+        simulator = CoolMasterSimulator(**{"units": 4, "seed": 1, **simulator_args})
+        received = []
+        simulator.command_listener = lambda verb, args, *_: received.append(verb)
+        port = await simulator.start()
+        client = CoolMasterClient("127.0.0.1", port, **{"timeout": 1, **(client_args or {})})
+        try:
+            await test(client, simulator)
+        finally:
+            await client.close()
+            await simulator.stop()
+        return received
+
+    return asyncio.run(run())
+
+
+def test_commands_go_ahead_of_queued_polls():
+    async def test(client, simulator):
+        polls = [asyncio.create_task(client._make_request("ls2", PRIORITY_POLL)) for _ in range(3)]
+        command = asyncio.create_task(client._make_request("on L1.001", PRIORITY_COMMAND))
+        await asyncio.gather(*polls, command)
+        assert simulator.units["L1.001"].is_on
+
+    assert _run_against_simulator(test, latency=0.01) == ["on", "ls2", "ls2", "ls2"]
+
+
+def test_close_fails_queued_requests():
+    async def test(client, simulator):
+        queued = asyncio.create_task(client._make_request("ls2"))
+        await asyncio.sleep(0)
+        await client.close()
+        try:
+            await queued
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("queued request survived close()")
+
+    _run_against_simulator(test)
+
+
+def test_send_batch_reports_each_unit():
+    async def test(client, simulator):
+        results = await client.send_batch([
+            ("L1.001", ["on L1.001", "heat L1.001"]),
+            ("L9.999", ["on L9.999"]),
+            ("L1.002", ["off L1.002"]),
+        ])
+        assert results == {"L1.001": None, "L9.999": "Unknown UID", "L1.002": None}
+        assert simulator.units["L1.001"].mode == "Heat" and not simulator.units["L1.002"].is_on
+
+    for depth in (1, 4):
+        _run_against_simulator(test, {"pipeline_depth": depth})
+
+
+def test_send_batch_partial_failure():
+    async def test(client, simulator):
+        answered = []
+
+        async def send(command, line_handler=None):
+            if len(answered) == 2:
+                raise asyncio.TimeoutError("no answer")  # the controller stops answering
+            answered.append(command)
+            return ""
+
+        client._send = send
+        results = await client.send_batch([
+            ("L1.001", ["on L1.001", "heat L1.001"]),
+            ("L1.002", ["on L1.002"]),
+            ("L1.003", ["on L1.003"]),
+        ])
+        assert results["L1.001"] is None
+        assert results["L1.002"] == "no answer"
+        assert results["L1.003"] == "not sent"
+
+    _run_against_simulator(test)
+
+
+def test_send_command_leaves_out_what_is_already_in_effect():
+    async def test(client, simulator):
+        simulator.units["L1.001"].is_on = True
+        current = UnitState("L1.001", True, 21.0, 22.0, "low", "cool", "OK", False, "idle")
+        await client.send_command("L1.001", "mode", "heat", current)
+        await client.send_command("L1.001", "mode", "cool", None)  # state unknown: everything is sent
+        assert simulator.units["L1.001"].mode == "Cool"
+
+    assert _run_against_simulator(test) == ["heat", "on", "cool"]
+
+
+def test_send_command_raises_on_refusal():
+    async def test(client, simulator):
+        with pytest.raises(RuntimeError, match="Unknown UID"):
+            await client.send_command("L9.999", "fan_mode", "high")
+
+    _run_against_simulator(test)
+
+
+def test_pipelined_responses_match_serial_ones():
+    uids = ["L1.001", "L1.002", "L1.003", "L1.004"]
+    responses = {}
+
+    for depth in (1, 4):
+        async def test(client, simulator):
+            responses[depth] = await client.get_properties(uids)
+            assert client.pipeline_depth == depth
+
+        _run_against_simulator(test, {"pipeline_depth": depth})
+    assert responses[4] == responses[1] and "Modes" in responses[4]["L1.003"]
+
+
+def test_falls_back_to_serial_when_controller_drops_pipelined_input():
+    async def test(client, simulator):
+        properties = await client.get_properties(["L1.001", "L1.002", "L1.003"])
+        assert client.pipeline_depth == 1
+        assert all(text.startswith(uid) for uid, text in properties.items())
+
+    _run_against_simulator(test, {"pipeline_depth": 4, "timeout": 0.2}, pipelining=False)
+
+
+def test_reply_that_is_not_utf8():
+    for depth in (1, 4):
+        async def test(client, simulator):
+            execute, reply = simulator.execute, simulator._reply
+            simulator.execute = lambda verb, args: "NAME\r\nOK" if args == ["L1.002"] else execute(verb, args)
+            simulator._reply = lambda loop, writer, data: reply(loop, writer, data.replace(b"NAME", b"d\xe9tente"))
+            properties = await asyncio.wait_for(client.get_properties(["L1.001", "L1.002", "L1.003"]), 2)
+            assert properties["L1.002"] == "d�tente"
+            assert properties["L1.003"].startswith("L1.003")
+
+        _run_against_simulator(test, {"pipeline_depth": depth})
+
+
+def test_worker_survives_an_unexpected_error():
+    for depth in (1, 4):
+        async def test(client, simulator):
+            def broken_handler(line):
+                raise ValueError("parser bug")
+
+            with pytest.raises((ValueError, RuntimeError), match="parser bug"):
+                await asyncio.wait_for(client._make_requests(["ls2", "ls2"], line_handler=broken_handler), 2)
+            # The worker is still there, and the connection is back in step
+            assert len(await asyncio.wait_for(client.get_status(), 2)) == 4
+
+        _run_against_simulator(test, {"pipeline_depth": depth})
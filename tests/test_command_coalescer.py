@@ -0,0 +1,91 @@
+import asyncio
+
+from coolmaster.client import unit_commands
+from coolmaster.command_coalescer import CommandCoalescer
+from coolmaster.unit_state import UnitState
+
+WINDOW = 0.05
+
+
+def _unit(is_on=True, thermostat=21.0, hvac_mode="heat", fan_mode="low"):
+    return UnitState("L1.001", is_on, thermostat, 22.0, fan_mode, hvac_mode, "OK", False, "idle")
+
+
+def _coalescer(fail=0):
+    """A coalescer whose sends record the controller commands they would issue; the first `fail` sends raise."""
+    sent = []
+
+    async def send(uid, command_type, value, current):
+        if len(sent) < fail:
+            sent.append(None)
+            raise ConnectionError("controller gone")
+        sent.append(unit_commands(uid, command_type, value, current))
+
+    return CommandCoalescer(WINDOW, send), sent
+
+
+async def _burst(coalescer, command_type, values, current):
+    tasks = []
+    for value in values:
+        tasks.append(asyncio.create_task(coalescer.submit("L1.001", command_type, value, current)))
+        await asyncio.sleep(WINDOW / 10)
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_single_command_is_sent_at_once():
+    async def run():
+        coalescer, sent = _coalescer()
+        started = asyncio.get_running_loop().time()
+        assert await coalescer.submit("L1.001", "fan_mode", "high", _unit())
+        assert asyncio.get_running_loop().time() - started < WINDOW / 2
+        assert sent == [["fspeed L1.001 high"]]
+
+    asyncio.run(run())
+
+
+def test_burst_sends_first_and_last_value():
+    async def run():
+        coalescer, sent = _coalescer()
+        results = await _burst(coalescer, "temperature", ["22", "23", "24", "25"], _unit())
+        assert results == [True, False, False, True]
+        assert sent == [["temp L1.001 22"], ["temp L1.001 25"]]
+
+    asyncio.run(run())
+
+
+def test_command_matching_current_state_is_not_sent():
+    async def run():
+        coalescer, sent = _coalescer()
+        assert not await coalescer.submit("L1.001", "temperature", "21.0", _unit())
+        assert sent == []
+
+    asyncio.run(run())
+
+
+def test_held_command_back_to_the_sent_value_is_not_sent():
+    async def run():
+        coalescer, sent = _coalescer()
+        assert await _burst(coalescer, "temperature", ["22", "23", "22.0"], _unit()) == [True, False, False]
+        assert sent == [["temp L1.001 22"]]
+
+    asyncio.run(run())
+
+
+def test_held_command_is_measured_against_the_state_after_the_last_send():
+    async def run():
+        coalescer, sent = _coalescer()
+        # Off → cool turns the unit on; the held "dry" must not send another "on"
+        await _burst(coalescer, "mode", ["cool", "heat", "dry"], _unit(is_on=False))
+        assert sent == [["on L1.001", "cool L1.001"], ["dry L1.001"]]
+
+    asyncio.run(run())
+
+
+def test_failed_send_is_not_used_for_dedup():
+    async def run():
+        coalescer, sent = _coalescer(fail=1)
+        results = await _burst(coalescer, "temperature", ["22", "23", "22"], _unit())
+        assert isinstance(results[0], ConnectionError)
+        assert sent == [None, ["temp L1.001 22"]]
+
+    asyncio.run(run())
@@ -0,0 +1,26 @@
+import logging
+
+import pytest
+
+import logs
+
+
+@pytest.fixture(autouse=True)
+def restore_root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield
+    root.handlers, root.level = handlers, level
+
+
+def test_unknown_level_falls_back_to_info(capsys):
+    logs.setup("VERBOSE", buffer_level="debug")
+    root = logging.getLogger()
+    assert root.handlers[0].level == logging.INFO
+    assert root.handlers[1].level == logging.DEBUG
+    assert "Unknown LOG_LEVEL 'VERBOSE', using INFO" in capsys.readouterr().out
+
+
+def test_numeric_level():
+    logs.setup(logging.WARNING, buffer_size=0)
+    assert logging.getLogger().level == logging.WARNING
@@ -0,0 +1,100 @@
+import asyncio
+import random
+
+import pytest
+
+from bench.simulator import SimulatedUnit
+from coolmaster.client import CoolMasterClient, parse_ls2_line
+
+
+def test_parse_ls2_line():
+    state = parse_ls2_line(b"L1.001 ON  24.5C 26.1C Med  Cool OK  - 1")
+    assert (state.uid, state.is_on, state.thermostat, state.temperature) == ("L1.001", True, 24.5, 26.1)
+    assert (state.fan_mode, state.hvac_mode, state.status, state.has_error, state.state) == (
+        "medium", "cool", "OK", False, "cooling")
+
+
+def test_parse_ls2_line_fault_and_off():
+    state = parse_ls2_line(b"L2.013 OFF 20.0C 19.5C Auto Heat E3  - 0")
+    assert (state.is_on, state.fan_mode, state.hvac_mode) == (False, "auto", "heat")
+    assert (state.status, state.has_error, state.state) == ("E3", True, "idle")
+
+
+@pytest.mark.parametrize("line", [b"", b"OK", b"L1.001 ON 24.5C", b"Unknown command"])
+def test_parse_ls2_line_ignores_other_lines(line):
+    assert parse_ls2_line(line) is None
+
+
+def test_parse_ls2_line_matches_simulator():
+    unit = SimulatedUnit("L3.042", random.Random(1))
+    unit.is_on, unit.setpoint, unit.room = True, 7.5, 22.0
+    unit.fan, unit.mode, unit.error, unit.demand = "High", "Dry", "OK", 0
+    state = parse_ls2_line(unit.ls2_line().encode())
+    assert (state.uid, state.thermostat, state.temperature, state.fan_mode, state.hvac_mode) == (
+        "L3.042", 7.5, 22.0, "high", "dry")
+
+
+def _client_reading(chunks):
+    """A client whose socket delivers `chunks` one read at a time."""
+    client = CoolMasterClient("127.0.0.1")
+    client.reader = asyncio.StreamReader()
+    for chunk in chunks:
+        client.reader.feed_data(chunk)
+    return client
+
+
+def test_lines_are_streamed_across_reads():
+    async def run():
+        client = _client_reading([b"L1.001 ON  24.5C 26.1C Med  Cool OK  - 1\r\nL1.0",
+                                  b"02 OFF 20.0C 19.5C Low  Heat OK  - 0\r\nOK\r\n>ls",
+                                  b"2 next\r\n"])
+        lines = []
+        assert await client._read_response(lines.append) == b""
+        assert [line[:6] for line in lines] == [b"L1.001", b"L1.002", b"OK"]
+        assert client._rx == b"ls2 next\r\n"  # the start of the next pipelined response stays buffered
+
+    asyncio.run(run())
+
+
+def _line(uid, setpoint="24.0C"):
+    return f"{uid} ON  {setpoint} 26.1C Med  Cool OK  - 1".encode()
+
+
+def test_only_changed_lines_are_reported():
+    async def run():
+        client = CoolMasterClient("127.0.0.1")
+        lines = [_line("L1.001"), _line("L1.002")]
+
+        async def fake_requests(commands, priority, line_handler=None, **_):
+            for line in lines + [b"OK"]:
+                line_handler(line)
+
+        client._make_requests = fake_requests
+        assert set(await client.get_changed_status()) == {"L1.001", "L1.002"}
+        assert await client.get_changed_status() == {}
+        lines[1] = _line("L1.002", "21.0C")
+        changed = await client.get_changed_status()
+        assert list(changed) == ["L1.002"] and changed["L1.002"].thermostat == 21.0
+
+    asyncio.run(run())
+
+
+def test_partial_response_leaves_the_cache_untouched():
+    async def run():
+        client = CoolMasterClient("127.0.0.1")
+        fail = True
+
+        async def fake_requests(commands, priority, line_handler=None, **_):
+            line_handler(_line("L1.001"))
+            if fail:
+                raise asyncio.TimeoutError()
+            line_handler(_line("L1.002"))
+
+        client._make_requests = fake_requests
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get_changed_status()
+        fail = False
+        # L1.001 was read before the timeout, but never published: it must still count as changed
+        assert set(await client.get_changed_status()) == {"L1.001", "L1.002"}
+
+    asyncio.run(run())
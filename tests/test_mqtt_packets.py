@@ -0,0 +1,81 @@
+import struct
+
+import pytest
+
+from mqtt.async_client import (
+    CONNACK, PUBLISH, TOPIC_ALIAS, TOPIC_ALIAS_MAXIMUM, AsyncMQTTClient,
+    _packet, _read_properties, _read_varint, _string, _utf8, _varint,
+)
+
+
+@pytest.mark.parametrize("value, encoded", [
+    (0, b"\x00"),
+    (127, b"\x7f"),
+    (128, b"\x80\x01"),
+    (16383, b"\xff\x7f"),
+    (16384, b"\x80\x80\x01"),
+    (268435455, b"\xff\xff\xff\x7f"),
+])
+def test_varint_round_trip(value, encoded):
+    assert _varint(value) == encoded
+    assert _read_varint(b"\xaa" + encoded + b"\xbb", 1) == (value, 1 + len(encoded))
+
+
+def test_packet_header():
+    assert _packet(CONNACK, b"\x00\x00") == b"\x20\x02\x00\x00"
+    assert _packet(PUBLISH, b"x" * 200, 0x03) == b"\x33\xc8\x01" + b"x" * 200
+
+
+def test_string_round_trip():
+    data = _utf8("coolmaster/L1.001/state") + _utf8("°C")
+    topic, offset = _string(data, 0)
+    unit, end = _string(data, offset)
+    assert (topic, unit, end) == ("coolmaster/L1.001/state", "°C", len(data))
+
+
+def test_read_properties():
+    block = (
+        bytes([TOPIC_ALIAS_MAXIMUM]) + struct.pack("!H", 10)
+        + b"\x02" + struct.pack("!I", 3600)                # message expiry, 4 bytes
+        + b"\x0b" + _varint(300)                           # subscription identifier, varint
+        + b"\x26" + _utf8("key") + _utf8("value")          # user property, skipped
+        + b"\x03" + _utf8("application/json")              # content type, length-prefixed
+    )
+    data = b"\xff" + _varint(len(block)) + block + b"payload"
+    properties, offset = _read_properties(data, 1)
+    assert properties == {TOPIC_ALIAS_MAXIMUM: 10, 0x02: 3600, 0x0B: 300, 0x03: b"application/json"}
+    assert data[offset:] == b"payload"
+
+
+def test_read_empty_properties():
+    assert _read_properties(b"\x00rest", 0) == ({}, 1)
+
+
+def test_publish_packet_with_topic_alias():
+    client = AsyncMQTTClient(None, protocol=5)
+    client.alias_maximum = 1
+    written = []
+    client._write = written.append
+
+    client._send_publish(1, "a/state", b"1", 1, False)
+    client._send_publish(2, "a/state", b"2", 1, False)
+    client._send_publish(3, "b/state", b"3", 1, False)  # no alias left: full topic, no alias property
+
+    alias = bytes([TOPIC_ALIAS]) + struct.pack("!H", 1)
+    assert written[0] == _packet(PUBLISH, _utf8("a/state") + struct.pack("!H", 1) + b"\x03" + alias + b"1", 0x02)
+    assert written[1] == _packet(PUBLISH, _utf8("") + struct.pack("!H", 2) + b"\x03" + alias + b"2", 0x02)
+    assert written[2] == _packet(PUBLISH, _utf8("b/state") + struct.pack("!H", 3) + b"\x00" + b"3", 0x02)
+
+
+def test_next_mid_wraps_and_skips_unacknowledged():
+    client = AsyncMQTTClient(None)
+    client._mid = 65534
+    client._unacked = {65535: None, 1: None, 3: None}
+    assert [client._next_mid() for _ in range(3)] == [2, 4, 5]
+
+
+def test_next_mid_exhausted():
+    client = AsyncMQTTClient(None)
+    client._unacked = dict.fromkeys(range(1, 65536))
+    with pytest.raises(RuntimeError):
+        client._next_mid()
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+from coolmaster.poll_scheduler import PollScheduler
+
+
+def _cycle(scheduler, changed=False):
+    scheduler.start_cycle()
+    scheduler.end_cycle(changed)
+
+
+def test_change_snaps_to_min_interval_then_backs_off_to_max():
+    async def run():
+        scheduler = PollScheduler(interval=2.0, min_interval=0.5, max_interval=5.0, backoff=2.0, active_hold=0.0)
+        _cycle(scheduler, changed=True)
+        assert scheduler.interval == 0.5
+        intervals = []
+        for _ in range(4):
+            _cycle(scheduler)
+            intervals.append(scheduler.interval)
+        assert intervals == [1.0, 2.0, 4.0, 5.0]
+
+    asyncio.run(run())
+
+
+def test_stays_fast_during_active_hold():
+    async def run():
+        scheduler = PollScheduler(interval=2.0, min_interval=0.5, max_interval=5.0, active_hold=60.0)
+        _cycle(scheduler, changed=True)
+        for _ in range(3):
+            _cycle(scheduler)
+        assert scheduler.interval == 0.5
+
+    asyncio.run(run())
+
+
+def test_cycles_are_timed_start_to_start():
+    async def run():
+        scheduler = PollScheduler(interval=0.1, min_interval=0.1, max_interval=0.1)
+        scheduler.start_cycle()
+        started = time.monotonic()
+        await asyncio.sleep(0.06)  # the poll itself
+        scheduler.end_cycle()
+        await scheduler.wait()
+        assert 0.09 <= time.monotonic() - started < 0.15
+
+    asyncio.run(run())
+
+
+def test_overrun_starts_next_cycle_at_once():
+    async def run():
+        scheduler = PollScheduler(interval=0.05, min_interval=0.05, max_interval=0.05)
+        scheduler.start_cycle()
+        await asyncio.sleep(0.08)
+        scheduler.end_cycle()
+        assert scheduler.overran and scheduler.overruns == 1
+        started = time.monotonic()
+        await scheduler.wait()
+        assert time.monotonic() - started < 0.02
+
+    asyncio.run(run())
+
+
+def test_activity_cuts_a_long_wait_short():
+    async def run():
+        scheduler = PollScheduler(interval=10.0, min_interval=0.05, max_interval=10.0)
+        _cycle(scheduler)
+        started = time.monotonic()
+        asyncio.get_running_loop().call_later(0.02, scheduler.notify_activity)
+        await asyncio.wait_for(scheduler.wait(), 1)
+        assert time.monotonic() - started < 0.2
+        assert scheduler.interval == 0.05
+
+    asyncio.run(run())
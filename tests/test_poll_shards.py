@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from config import _parse_shards
+from coolmaster.controller import Controller
+from coolmaster.poll_shards import build_shards
+
+
+def _controller(name="", lines=(("L1", 8), ("L2", 4))):
+    controller = Controller(name, "127.0.0.1", scheduler_args=(2.0, 0.5, 10.0))
+    controller.unit_ids = [controller.qualify(f"{line}.{i:03d}") for line, count in lines for i in range(1, count + 1)]
+    return controller
+
+
+def _shards(controller, spec):
+    return {shard.name: shard for shard in build_shards(controller, spec)}
+
+
+def test_parse_shards():
+    assert _parse_shards("Line") == "line"
+    assert _parse_shards("occupied:1=L1.*, L2.001; storerooms=L3.*") == [
+        ("occupied", 1.0, ("L1.*", "L2.001")),
+        ("storerooms", None, ("L3.*",)),
+    ]
+    for spec in ("rest=L1.*", "a=L1.*;a=L2.*", "bad name=L1.*", "empty="):
+        with pytest.raises(ValueError):
+            _parse_shards(spec)
+
+
+def test_one_shard_per_line_reads_whole_lines():
+    async def run():
+        shards = build_shards(_controller("north"), "line")
+        assert [(s.name, s.selectors, len(s.unit_ids)) for s in shards] == [("L1", ["L1"], 8), ("L2", ["L2"], 4)]
+        assert [s.offset for s in shards] == [0.0, 1.0]  # staggered over the poll interval
+
+    asyncio.run(run())
+
+
+def test_named_shards_take_units_on_first_match():
+    async def run():
+        spec = [("occupied", 1.0, ("L1.00[12]", "L2.*")), ("more", None, ("L1.*", "L2.001"))]
+        shards = _shards(_controller(), spec)
+        assert shards["occupied"].unit_ids == {"L1.001", "L1.002", "L2.001", "L2.002", "L2.003", "L2.004"}
+        assert shards["more"].unit_ids == {f"L1.{i:03d}" for i in range(3, 9)}
+        assert "rest" not in shards  # every unit matched a shard
+
+    asyncio.run(run())
+
+
+def test_line_is_read_whole_once_a_shard_holds_a_quarter_of_it():
+    async def run():
+        spec = [("fast", 1.0, ("L1.001", "L1.002", "L2.001")), ("slow", 30.0, ("L1.003",))]
+        shards = _shards(_controller(), spec)
+        # 2 of 8 units of L1 is a quarter: one `ls2 L1`; 1 of 8 is read unit by unit; 1 of 4 units of L2 is a quarter
+        assert shards["fast"].selectors == ["L1", "L2"]
+        assert shards["slow"].selectors == ["L1.003"]
+        assert shards["rest"].unit_ids == {f"L1.{i:03d}" for i in range(4, 9)} | {"L2.002", "L2.003", "L2.004"}
+
+    asyncio.run(run())
+
+
+def test_fixed_interval_follows_commands_but_not_changes():
+    async def run():
+        shards = _shards(_controller(), [("storerooms", 30.0, ("L2.*",))])
+        fixed, adaptive = shards["storerooms"].scheduler, shards["rest"].scheduler
+        assert (fixed.base_interval, fixed.max_interval) == (30.0, 30.0)
+        assert (adaptive.base_interval, adaptive.max_interval) == (2.0, 10.0)
+
+        fixed.start_cycle()
+        fixed.end_cycle(changed=True)
+        assert fixed.interval == 30.0  # changed data keeps the fixed cadence
+        fixed.notify_activity()
+        assert fixed.interval == 0.5   # a command polls soon
+
+    asyncio.run(run())
+
+
+def test_notify_activity_reaches_the_units_shard():
+    async def run():
+        controller = _controller("north")
+        controller.shards = build_shards(controller, "line")
+        controller.notify_activity("north.L2.003")
+        assert [s.scheduler.interval for s in controller.shards] == [2.0, 0.5]
+
+    asyncio.run(run())
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from bench.broker import BrokerStandIn
+from mqtt.async_client import AsyncMQTTClient
+
+
+async def _wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("timed out")
+        await asyncio.sleep(0.01)
+
+
+async def _publish_through_broker(alias_maximum, protocol, topics):
+    broker = BrokerStandIn(topic_alias_maximum=alias_maximum)
+    port = await broker.start()
+    received, acked = [], []
+    broker.publish_listener = lambda topic, payload, _: received.append((topic, payload))
+
+    client = AsyncMQTTClient(asyncio.get_running_loop(), protocol=protocol)
+    client.on_publish = lambda _client, _userdata, mid: acked.append(mid)
+    client.connect("127.0.0.1", port)
+    client.loop_start()
+    try:
+        await _wait_for(client.is_connected)
+        for i, topic in enumerate(topics):
+            client.publish(topic, str(i), qos=1)
+        await _wait_for(lambda: len(acked) == len(topics))
+        return client, received
+    finally:
+        client.disconnect()
+        await broker.stop()
+
+
+@pytest.mark.parametrize("alias_maximum", [0, 1, 1000])
+def test_topics_survive_aliasing(alias_maximum):
+    topics = ["a/state", "b/state", "a/state", "b/state", "c/state", "a/state"]
+    client, received = asyncio.run(_publish_through_broker(alias_maximum, 5, topics))
+    assert received == [(topic, str(i).encode()) for i, topic in enumerate(topics)]
+    assert client.alias_maximum == alias_maximum
+    assert len(client._aliases) == min(alias_maximum, 3)
+
+
+def test_no_aliases_with_mqtt_311():
+    client, received = asyncio.run(_publish_through_broker(1000, 4, ["a/state", "a/state"]))
+    assert [topic for topic, _ in received] == ["a/state", "a/state"]
+    assert client._aliases == {}
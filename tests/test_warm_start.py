@@ -0,0 +1,161 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import mqtt.publisher as publisher_module
+import snapshot
+from coolmaster.capabilities import UnitCapabilities
+from coolmaster.controller import Controller, ControllerRouter
+from coolmaster.unit_state import FIELDS, StatusTable, UnitState
+from mqtt.async_client import MQTT_ERR_SUCCESS, Message, MessageInfo
+from mqtt.publish_queue import PublishQueue
+from mqtt.publisher import RETAINED_CHECK_TOPIC, MQTTPublisher
+
+UIDS = ["L1.001", "L1.002"]
+
+
+def _unit(uid, setpoint=22.0):
+    return UnitState(uid, True, setpoint, 21.0, "low", "cool", "OK", False, "idle")
+
+
+def _bridge(publish_mode="json"):
+    controller = Controller("north", "127.0.0.1")
+    return [controller], SimpleNamespace(publish_mode=publish_mode, discovery_hashes={}), StatusTable()
+
+
+def _saved_snapshot(tmp_path):
+    controllers, mqtt, last_status = _bridge()
+    controllers[0].unit_ids = [f"north.{uid}" for uid in UIDS]
+    controllers[0].capabilities.store("north.L1.001", UnitCapabilities(["cool", "heat"], ["low", "high"], 16, 30))
+    for uid in controllers[0].unit_ids:
+        last_status.store(_unit(uid))
+    mqtt.discovery_hashes["homeassistant/climate/coolmaster_north_L1_001/config"] = "abc"
+    path = tmp_path / "snapshot.json"
+    snapshot.save(path, snapshot.capture(controllers, mqtt, last_status))
+    return path
+
+
+def test_restore_seeds_units_state_hashes_and_capabilities(tmp_path):
+    path = _saved_snapshot(tmp_path)
+    controllers, mqtt, last_status = _bridge()
+    restored = snapshot.restore(snapshot.load(path), controllers, mqtt, last_status)
+
+    assert restored == controllers
+    assert controllers[0].unit_ids == ["north.L1.001", "north.L1.002"]
+    row = last_status.get("north.L1.002")
+    assert [getattr(row, name) for name in FIELDS] == [getattr(_unit("north.L1.002"), name) for name in FIELDS]
+    assert mqtt.discovery_hashes == {"homeassistant/climate/coolmaster_north_L1_001/config": "abc"}
+    assert controllers[0].capabilities.get("north.L1.001").modes == ("cool", "heat")
+
+
+def test_restore_after_publish_mode_change_keeps_only_units(tmp_path):
+    path = _saved_snapshot(tmp_path)
+    controllers, mqtt, last_status = _bridge(publish_mode="attributes")
+    snapshot.restore(snapshot.load(path), controllers, mqtt, last_status)
+
+    assert controllers[0].unit_ids == ["north.L1.001", "north.L1.002"]
+    assert len(last_status) == 0 and mqtt.discovery_hashes == {}
+    assert controllers[0].capabilities.get("north.L1.001").modes == ("cool", "heat")
+
+
+def test_load_ignores_unusable_files(tmp_path):
+    assert snapshot.load(tmp_path / "missing.json") is None
+    (tmp_path / "broken.json").write_text("{")
+    assert snapshot.load(tmp_path / "broken.json") is None
+    (tmp_path / "old.json").write_text(json.dumps({"version": snapshot.VERSION + 1}))
+    assert snapshot.load(tmp_path / "old.json") is None
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []           # topics, in publish order
+        self.subscriptions = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.sent.append(topic)
+        return MessageInfo(len(self.sent), MQTT_ERR_SUCCESS)
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.append(topic)
+
+    def unsubscribe(self, topic):
+        self.subscriptions.remove(topic)
+
+    def is_connected(self):
+        return True
+
+
+def _publisher(loop):
+    """An MQTTPublisher on a fake client, with both units' discovery already on the broker."""
+    controller = Controller("", "127.0.0.1")
+    controller.unit_ids = list(UIDS)
+    publisher = MQTTPublisher.__new__(MQTTPublisher)
+    publisher.coolmaster, publisher.loop, publisher.publish_mode = ControllerRouter([controller]), loop, "json"
+    publisher.last_status, publisher.discovery_hashes, publisher._discovery, publisher._retained = StatusTable(), {}, {}, None
+    publisher.client = FakeClient()
+    publisher.queue = PublishQueue(publisher.client, loop)
+    publisher.queue.start()
+    for uid in UIDS:
+        publisher.publish_climate_config(uid)
+        publisher.last_status.store(_unit(uid))
+        controller.client._lines[uid.encode()] = (b"", _unit(uid))
+    return publisher
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _connect(publisher, retained_uids):
+    """Connect, with the broker holding the climate discovery of `retained_uids`; returns what was published."""
+    publisher.client.sent.clear()
+    publisher._resync()
+    assert publisher.client.subscriptions == [RETAINED_CHECK_TOPIC]
+    for uid in retained_uids:
+        topic = f"homeassistant/climate/coolmaster_{uid.replace('.', '_')}/config"
+        payload = publisher._discovery_for(uid)[topic].encode()
+        publisher._on_message(publisher.client, None, Message(topic, payload, 0, True))
+    await asyncio.sleep(0.01)
+    await _settle()
+    assert publisher.client.subscriptions == []
+    for mid in range(1, len(publisher.client.sent) + 1):
+        publisher.queue.on_publish_in_loop(None, None, mid)
+    return list(publisher.client.sent)
+
+
+def test_connect_republishes_only_units_the_broker_lost(monkeypatch):
+    monkeypatch.setattr(publisher_module, "RETAINED_CHECK_DELAY", 0.0)
+
+    async def run():
+        publisher = _publisher(asyncio.get_running_loop())
+        publisher.queue.set_connected(True)
+        await _settle()
+        for mid in range(1, len(publisher.client.sent) + 1):
+            publisher.queue.on_publish_in_loop(None, None, mid)
+        client = publisher.coolmaster.controllers[0].client
+
+        # The broker still has everything: neither discovery nor the restored state is sent again
+        assert await _connect(publisher, UIDS) == []
+        assert len(publisher.last_status) == 2
+
+        # It lost L1.002: its discovery goes out again, and its state on the next poll
+        sent = await _connect(publisher, ["L1.001"])
+        assert sorted(sent) == sorted(publisher._discovery_for("L1.002"))
+        assert "L1.002" not in publisher.last_status and "L1.001" in publisher.last_status
+        assert b"L1.002" not in client._lines and b"L1.001" in client._lines
+
+    asyncio.run(run())
+
+
+def test_discovery_still_queued_is_not_checked(monkeypatch):
+    monkeypatch.setattr(publisher_module, "RETAINED_CHECK_DELAY", 0.0)
+
+    async def run():
+        publisher = _publisher(asyncio.get_running_loop())  # not connected yet: nothing has gone out
+        publisher._resync()
+        assert publisher.client.subscriptions == []
+        await _settle()
+        assert len(publisher.client.sent) == sum(len(publisher._discovery_for(uid)) for uid in UIDS)
+
+    asyncio.run(run())